@@ -0,0 +1,20 @@
+"""
+Celery application for creative_app.
+
+Start a worker for the Groq/Whisper stages and a separate one for Stable Diffusion:
+    celery -A creative_app worker -Q default -c 4
+    celery -A creative_app worker -Q diffusion -c 1
+
+With STORY_GENERATOR_TRANSCRIPTION_WORKERS set, also one worker per host for voice prompts:
+    celery -A creative_app worker -Q transcription --pool threads -c 8
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "creative_app.settings")
+
+app = Celery("creative_app")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
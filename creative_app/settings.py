@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -125,5 +126,79 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Celery Configuration (for background tasks)
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
\ No newline at end of file
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+# Run tasks inline in the web process (local development and testing, no broker needed)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'false').lower() in ('1', 'true', 'yes')
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+# Keep CPU-heavy diffusion on its own worker pool
+CELERY_TASK_ROUTES = {
+    'story_generator.tasks.render_images_task': {'queue': 'diffusion'},
+    'story_generator.tasks.transcribe_task': {'queue': 'transcription'},
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Acknowledge after the task returns, so a job whose worker died is redelivered; tasks skip finished jobs
+CELERY_TASK_ACKS_LATE = True
+
+# Generation pipeline: stages run concurrently where the stage graph allows
+STORY_GENERATOR_PIPELINE_WORKERS = 4
+# True: text stages on 'default'; once both image prompts exist, one 'diffusion' task renders both
+# images in a single batched pipeline call. False: one task runs the whole graph
+STORY_GENERATOR_DIFFUSION_QUEUE = True
+
+# Story stream endpoint: how often it re-reads the job row, and how long before it hands over to the result page
+STORY_GENERATOR_STREAM_POLL_INTERVAL = 0.25  # Seconds
+STORY_GENERATOR_STREAM_TIMEOUT = 300  # Seconds
+
+# Groq response cache file when GROQ_CACHE_BACKEND=sqlite and GROQ_CACHE_PATH is unset
+STORY_GENERATOR_LLM_CACHE_PATH = BASE_DIR / 'cache' / 'llm_cache.sqlite3'
+
+# Rendered diffusion images keyed by model, prompts, steps, guidance, size and seed (None disables)
+STORY_GENERATOR_IMAGE_CACHE_DIR = BASE_DIR / 'cache' / 'images'
+STORY_GENERATOR_IMAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Single-image requests from concurrent threads of one process are merged into batches of up to this
+# size (1 disables batching); the pipeline renders a story's two images as one batch by itself
+STORY_GENERATOR_IMAGE_BATCH_SIZE = 2
+STORY_GENERATOR_IMAGE_BATCH_WAIT = 0.25  # Seconds to wait for more jobs before rendering
+STORY_GENERATOR_IMAGE_BATCH_TIMEOUT = 900  # Seconds a caller waits for its batched render before using a placeholder
+# Write an approximate latent preview every N denoising steps
+STORY_GENERATOR_PREVIEW_EVERY = 5
+# CPU inference profile for Stable Diffusion: fp32, bf16, int8 (dynamic quantisation) or openvino
+STORY_GENERATOR_CPU_MODE = os.getenv('STORY_GENERATOR_CPU_MODE', 'fp32')
+STORY_GENERATOR_CPU_THREADS = int(os.getenv('STORY_GENERATOR_CPU_THREADS', 0)) or None  # None: cores available
+# NHWC conv layout: often faster convolutions, but it copies the UNet/VAE weights, so memory-mapped pages are no
+# longer shared between workers. None: off for fp32 with STORY_GENERATOR_MODEL_DIR, on otherwise
+STORY_GENERATOR_CHANNELS_LAST = None
+STORY_GENERATOR_TORCH_COMPILE = os.getenv('STORY_GENERATOR_TORCH_COMPILE', 'false').lower() in ('1', 'true', 'yes')
+STORY_GENERATOR_OPENVINO_DIR = BASE_DIR / 'cache' / 'openvino'  # Exported IR reused across restarts
+# CLIP encodings of recent positive prompts kept per image worker (negative prompts are always cached)
+STORY_GENERATOR_PROMPT_EMBED_CACHE_SIZE = 64
+# Service registry: load story/image/audio services at worker start instead of lazily
+STORY_GENERATOR_EAGER_LOAD = False
+STORY_GENERATOR_EAGER_SERVICES = None  # e.g. ['story', 'image']; None loads all services
+# Local safetensors/Whisper checkpoints loaded memory-mapped so worker processes share weight pages (None disables)
+STORY_GENERATOR_MODEL_DIR = os.getenv('STORY_GENERATOR_MODEL_DIR', str(BASE_DIR / 'cache' / 'models')) or None
+# RAM allowed for resident models per process (SD, bk-sdm-small, Whisper); idle models are evicted LRU first
+STORY_GENERATOR_MODEL_RAM_BUDGET = int(os.getenv('STORY_GENERATOR_MODEL_RAM_BUDGET_MB', 0)) * 1024 * 1024 or None
+STORY_GENERATOR_MODEL_IDLE_TIMEOUT = int(os.getenv('STORY_GENERATOR_MODEL_IDLE_TIMEOUT', 1800)) or None  # Seconds
+# Transcription backend: openai-whisper (fp32), whisper-int8 (dynamic int8) or faster-whisper
+# (CTranslate2 int8, needs 'pip install faster-whisper')
+STORY_GENERATOR_WHISPER_BACKEND = os.getenv('STORY_GENERATOR_WHISPER_BACKEND', 'openai-whisper')
+STORY_GENERATOR_WHISPER_MODEL = os.getenv('STORY_GENERATOR_WHISPER_MODEL', 'tiny')
+# Energy-based voice-activity detection: silence quieter than the threshold (dBFS) is not transcribed
+STORY_GENERATOR_VAD_ENABLED = True
+STORY_GENERATOR_VAD_THRESHOLD_DB = -45.0
+# Whisper worker processes, each holding one model (0 transcribes inside generate_story_task).
+# With workers, voice prompts go to the 'transcription' queue. Run ONE Celery worker per host for it,
+# with a thread pool so concurrent uploads share the processes and are batched together:
+#   celery -A creative_app worker -Q transcription --pool threads --concurrency 8
+# The processes count against STORY_GENERATOR_MODEL_RAM_BUDGET of that worker and stop when idle.
+STORY_GENERATOR_TRANSCRIPTION_WORKERS = int(os.getenv('STORY_GENERATOR_TRANSCRIPTION_WORKERS', 0))
+STORY_GENERATOR_TRANSCRIPTION_MAX_PENDING = 32  # Queued 30 s windows before submissions are rejected
+STORY_GENERATOR_TRANSCRIPTION_BATCH_SIZE = 4  # Windows decoded per encoder forward
+STORY_GENERATOR_TRANSCRIPTION_TIMEOUT = 300  # Seconds per upload
+# Transcripts keyed by upload hash + backend/model/VAD settings, checked before any audio model work (None disables)
+STORY_GENERATOR_TRANSCRIPTION_CACHE_PATH = BASE_DIR / 'cache' / 'transcriptions.sqlite3'
+STORY_GENERATOR_TRANSCRIPTION_CACHE_MAX_ENTRIES = 2000  # Least recently used entries are evicted beyond this
+STORY_GENERATOR_TRANSCRIPTION_CACHE_TTL = 30 * 24 * 3600  # Seconds
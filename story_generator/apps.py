@@ -1,6 +1,18 @@
+import logging
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class StoryGeneratorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "story_generator"
+
+    def ready(self):
+        # Optionally load the heavy models once at worker start instead of on first request
+        if getattr(settings, 'STORY_GENERATOR_EAGER_LOAD', False):
+            from .service_registry import registry
+            registry.warm_up(getattr(settings, 'STORY_GENERATOR_EAGER_SERVICES', None))
+            from .model_store import startup_timings
+            logger.info(f"Startup timing report: {startup_timings.report()}")
@@ -0,0 +1,129 @@
+import logging
+import os
+import subprocess
+import threading
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000  # Whisper's input rate
+WINDOW_SECONDS = 30  # Whisper's context length
+FRAME_SAMPLES = 320  # 20 ms analysis frames
+
+
+class AudioDecodeError(Exception):
+    """ffmpeg could not decode the upload"""
+
+
+def _file_path(audio_file):
+    """Path of an upload already on disk (saved FieldFile, TemporaryUploadedFile), else None"""
+    for attr in ('temporary_file_path', 'path'):
+        try:
+            value = getattr(audio_file, attr, None)
+            path = value() if callable(value) else value
+        except Exception:
+            continue
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def decode_audio(audio_file, sample_rate=SAMPLE_RATE, block_seconds=1):
+    """
+    Decode an upload to mono float32 PCM, yielding blocks as ffmpeg produces them
+
+    Files already on disk are read by ffmpeg directly; in-memory uploads are piped
+    to ffmpeg's stdin chunk by chunk. No temporary copy is written either way, and
+    only one block is held in memory at a time.
+    """
+    path = _file_path(audio_file)
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', '0',
+        '-i', path or 'pipe:0',
+        '-f', 'f32le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1',
+    ]
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL if path else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    def feed():
+        # Runs beside the reader so neither pipe fills up and deadlocks ffmpeg
+        try:
+            if hasattr(audio_file, 'seek'):
+                audio_file.seek(0)
+            for chunk in audio_file.chunks():
+                process.stdin.write(chunk)
+        except (BrokenPipeError, ValueError):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    writer = None
+    if not path:
+        writer = threading.Thread(target=feed, name='ffmpeg-feed', daemon=True)
+        writer.start()
+
+    block_bytes = int(block_seconds * sample_rate) * 4
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+        stderr = process.stderr.read().decode('utf-8', errors='replace').strip()
+        if process.wait() != 0:
+            raise AudioDecodeError(f"ffmpeg failed to decode audio: {stderr[-500:]}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+        if writer is not None:
+            writer.join(timeout=5)
+
+
+def frame_energy(samples, frame=FRAME_SAMPLES):
+    """Mean-square energy of consecutive frames (a trailing partial frame is dropped)"""
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    return np.einsum('ij,ij->i', frames, frames) / frame
+
+
+def iter_windows(blocks, sample_rate=SAMPLE_RATE, window_seconds=WINDOW_SECONDS, search_seconds=1.0):
+    """
+    Regroup decoded blocks into windows of at most window_seconds
+
+    Each window is cut at the quietest frame of its final search_seconds, so words
+    are rarely split across windows; the rest carries over into the next window.
+    Memory stays bounded by one window plus one block.
+    """
+    window_samples = int(window_seconds * sample_rate)
+    search_samples = int(search_seconds * sample_rate)
+    pending = []
+    pending_samples = 0
+
+    for block in blocks:
+        pending.append(block)
+        pending_samples += len(block)
+        while pending_samples >= window_samples:
+            samples = np.concatenate(pending)
+            energy = frame_energy(samples[window_samples - search_samples:window_samples])
+            cut = window_samples
+            if len(energy):
+                cut = window_samples - search_samples + int(np.argmin(energy)) * FRAME_SAMPLES
+            # Never emit an empty window, even for pathological energy profiles
+            cut = max(cut, FRAME_SAMPLES)
+            yield samples[:cut]
+            pending = [samples[cut:]]
+            pending_samples = len(pending[0])
+
+    if pending_samples:
+        yield np.concatenate(pending)
@@ -1,93 +1,239 @@
-import whisper
 import logging
-import tempfile
-import os
-import torch
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from django.conf import settings
+from .whisper_backends import create_backend
+from .residency import get_residency_manager
+from .audio_decode import decode_audio, iter_windows
+from .vad import VadStats, trim_silence
+from .transcription_pool import TranscriptionPool, TranscriptionTimeout
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Approximate fp32 footprint, used for budgeting until the model has been loaded once
+WHISPER_SIZE_ESTIMATES = {
+    'tiny': 150 * 1024 * 1024,
+    'base': 290 * 1024 * 1024,
+    'small': 970 * 1024 * 1024,
+    'medium': 3000 * 1024 * 1024,
+}
+
 class AudioService:
-    def __init__(self):
+    def __init__(self, backend=None, model_size=None):
+        """
+        Args:
+            backend (str): Transcription backend (see whisper_backends.BACKENDS); defaults to settings
+            model_size (str): Whisper size (tiny, base, small, medium, large); defaults to settings
+        """
         logger.info("Initializing Whisper for audio transcription")
-        self._initialize_whisper()
-    
-    def _initialize_whisper(self):
-        """Initialize Whisper model for CPU"""
-        try:
-            # Use the tiny model for fastest CPU processing
-            model_size = "tiny"  # Options: tiny, base, small, medium, large
-            
-            logger.info(f"Loading Whisper model: {model_size}")
-            
-            # Load with CPU-specific settings
-            self.model = whisper.load_model(
-                model_size,
-                device="cpu"
+        self.backend = create_backend(backend, model_size)
+        self.model_size = self.backend.model_size
+        self.model_name = f"whisper-{self.model_size}-{self.backend.name}"
+        self.available = True
+        # Voice-activity filtering before decoding; totals show how much audio it saved
+        self.vad_enabled = getattr(settings, 'STORY_GENERATOR_VAD_ENABLED', True)
+        self.vad_threshold_db = getattr(settings, 'STORY_GENERATOR_VAD_THRESHOLD_DB', -45.0)
+        self.audio_seconds = 0.0
+        self.skipped_seconds = 0.0
+        self.last_vad = None
+        # The service is shared by every thread in the worker, and Whisper's decoder installs
+        # per-call kv-cache hooks on the model, so in-process decodes run one at a time
+        self._model_lock = threading.Lock()
+        # The residency manager unloads Whisper when idle or when the RAM budget is needed elsewhere
+        self.residency = get_residency_manager()
+        self.pool_workers = getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_WORKERS', 0)
+        self._pool = None
+        if self.pool_workers:
+            # The worker processes are managed like a model: started on first use (only in the
+            # process that transcribes), counted against the RAM budget by their RSS, and shut
+            # down when idle
+            self.pool_name = f"{self.model_name}-pool"
+            estimated_bytes = WHISPER_SIZE_ESTIMATES.get(self.model_size, 0) * self.pool_workers
+            self.residency.register(
+                self.pool_name,
+                self._initialize_pool,
+                self._close_pool,
+                estimated_bytes=estimated_bytes,
+                # Workers are still loading right after the spawn, so the estimate is a floor
+                measure=lambda pool: max(pool.rss_bytes(), estimated_bytes)
             )
-            
-            logger.info("Whisper model loaded successfully")
-            
+            logger.info(f"Transcription runs in a pool of {self.pool_workers} worker process(es)")
+            return
+        
+        self.residency.register(
+            self.model_name,
+            self._initialize_whisper,
+            estimated_bytes=WHISPER_SIZE_ESTIMATES.get(self.model_size, 0)
+        )
+        
+        try:
+            self.residency.acquire(self.model_name)
+            self.residency.release(self.model_name)
         except Exception as e:
             logger.error(f"Error loading Whisper model: {e}")
-            self.model = None
+            self.available = False
+    
+    def _initialize_whisper(self):
+        """Initialize Whisper model for CPU (residency loader)"""
+        logger.info(f"Loading Whisper model: {self.model_size} ({self.backend.name})")
+        model = self.backend.load()
+        logger.info("Whisper model loaded successfully")
+        return model
     
-    def transcribe_audio(self, audio_file):
-        """Transcribe audio file to text using Whisper"""
-        if not self.model:
+    def _initialize_pool(self):
+        """Start the Whisper worker processes (residency loader)"""
+        self._pool = TranscriptionPool(
+            self.backend.name,
+            self.model_size,
+            workers=self.pool_workers,
+            max_pending=getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_MAX_PENDING', 32),
+            batch_size=getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_BATCH_SIZE', 4),
+            timeout=getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_TIMEOUT', 300)
+        )
+        return self._pool
+    
+    def _close_pool(self, pool):
+        """Stop the worker processes (residency unload hook)"""
+        pool.close()
+        if self._pool is pool:
+            self._pool = None
+    
+    def transcribe_audio(self, audio_file, on_partial=None):
+        """
+        Transcribe audio file to text using Whisper
+        
+        Args:
+            audio_file: Django UploadedFile or FieldFile
+            on_partial (callable): Called with the transcript so far after each window
+        
+        Returns:
+            str: The full transcription, or None on failure
+        """
+        if not self.available:
             logger.error("Whisper model not available")
             return None
         
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_file:
-                # Write uploaded file to temporary file
-                for chunk in audio_file.chunks():
-                    tmp_file.write(chunk)
-                tmp_file_path = tmp_file.name
-            
             logger.info("Starting audio transcription...")
             
-            # Transcribe audio with CPU-optimized settings
-            result = self.model.transcribe(
-                tmp_file_path,
-                fp16=False,  # Disable fp16 for CPU
-                verbose=False
-            )
-            
-            transcription = result["text"].strip()
-            
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
+            transcription = ""
+            for transcription in self.iter_transcription(audio_file):
+                if on_partial is not None:
+                    on_partial(transcription)
             
             logger.info(f"Audio transcribed successfully: {transcription[:100]}...")
             return transcription
             
         except Exception as e:
             logger.error(f"Error transcribing audio: {e}")
-            # Clean up temp file if it exists
-            try:
-                if 'tmp_file_path' in locals():
-                    os.unlink(tmp_file_path)
-            except:
-                pass
             return None
     
+    def iter_transcription(self, audio_file):
+        """
+        Decode and transcribe an upload window by window, yielding the transcript so far
+        
+        The upload is streamed through ffmpeg into 16 kHz float32 blocks, silence is
+        trimmed by the VAD, and the speech is grouped into windows of at most 30 s, so
+        memory stays bounded and silent stretches are never decoded.
+        """
+        stats = VadStats()
+        blocks = decode_audio(audio_file)
+        if self.vad_enabled:
+            blocks = trim_silence(blocks, stats, threshold_db=self.vad_threshold_db)
+        
+        if self.pool_workers:
+            texts = self._transcribe_pooled(iter_windows(blocks))
+        else:
+            texts = self._transcribe_local(iter_windows(blocks))
+        
+        parts = []
+        for text in texts:
+            if text:
+                parts.append(text)
+            yield " ".join(parts)
+        
+        if self.vad_enabled:
+            self._record_vad(stats)
+    
+    def _transcribe_local(self, windows):
+        """Transcribe windows in this process, one after another"""
+        model = self.residency.acquire(self.model_name)
+        try:
+            previous = ""
+            for window in windows:
+                # The previous text keeps names and spelling consistent across windows
+                with self._model_lock:
+                    text = self.backend.transcribe(model, window, initial_prompt=previous[-200:] or None)
+                previous = f"{previous} {text}".strip()
+                yield text
+        finally:
+            self.residency.release(self.model_name)
+    
+    def _transcribe_pooled(self, windows):
+        """Fan windows out to the worker pool as they are decoded; texts come back in order"""
+        pool = self.residency.acquire(self.pool_name)
+        try:
+            deadline = time.monotonic() + pool.timeout
+            futures = deque()
+            for window in windows:
+                futures.append(pool.submit(window))
+                # Hand back leading windows as soon as they finish, for partial transcripts
+                while futures and futures[0].done():
+                    yield futures.popleft().result()
+            
+            while futures:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TranscriptionTimeout(f"Transcription did not finish within {pool.timeout}s")
+                try:
+                    yield futures.popleft().result(timeout=remaining)
+                except FutureTimeout:
+                    raise TranscriptionTimeout(f"Transcription did not finish within {pool.timeout}s")
+        finally:
+            self.residency.release(self.pool_name)
+    
+    def transcription_pool_stats(self):
+        pool = self._pool
+        return pool.stats() if pool is not None else None
+    
+    def _record_vad(self, stats):
+        self.last_vad = stats.as_dict()
+        self.audio_seconds += stats.total_seconds
+        self.skipped_seconds += stats.skipped_seconds
+        if not stats.segments:
+            logger.warning("No speech detected in the audio")
+        logger.info(
+            f"VAD skipped {stats.skipped_seconds:.1f}s of {stats.total_seconds:.1f}s "
+            f"({stats.segments} speech segment(s))"
+        )
+    
     def get_supported_formats(self):
         """Return list of supported audio formats"""
         return ['.wav', '.mp3', '.m4a', '.ogg', '.flac', '.aac']
     
     def is_audio_supported(self):
         """Check if audio processing is available"""
-        return self.model is not None
+        return self.available
     
     def get_model_info(self):
         """Get information about the loaded model"""
-        if self.model:
+        if self.available:
             return {
                 'model_available': True,
-                'model_type': 'whisper-tiny',
+                'model_type': self.model_name,
+                'backend': self.backend.name,
+                'resident': self.residency.is_resident(self.pool_name if self.pool_workers else self.model_name),
+                'pool': self.transcription_pool_stats(),
                 'device': 'cpu',
+                'vad': {
+                    'enabled': self.vad_enabled,
+                    'audio_seconds': round(self.audio_seconds, 1),
+                    'skipped_seconds': round(self.skipped_seconds, 1),
+                    'last': self.last_vad,
+                },
                 'supported_languages': 'multilingual'
             }
         return {
@@ -0,0 +1,78 @@
+import logging
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Compositor:
+    """Character-over-background compositing in uint8 with per-thread reusable buffers"""
+
+    def __init__(self, size=(512, 512), threshold=240, feather=0):
+        """
+        Args:
+            size (tuple): Output (width, height); inputs of that size are used without resizing
+            threshold (int): Character pixels brighter than this count as background
+            feather (int): Gaussian blur radius for soft mask edges (0 keeps the hard mask)
+        """
+        self.size = size
+        self.threshold = threshold
+        self.feather = feather
+        self._local = threading.local()
+
+    def _buffers(self):
+        # Scratch arrays are reused across calls; one set per thread
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            width, height = self.size
+            buffers = {
+                'gray': np.empty((height, width), dtype=np.uint8),
+                'mask': np.empty((height, width), dtype=np.uint8),
+            }
+            if self.feather:
+                buffers['alpha'] = np.empty((height, width), dtype=np.float32)
+                buffers['work'] = np.empty((height, width, 3), dtype=np.float32)
+            self._local.buffers = buffers
+        return buffers
+
+    def _to_array(self, image):
+        """Writable RGB uint8 array at the output size, resizing only when needed"""
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        if image.size != self.size:
+            image = image.resize(self.size, Image.Resampling.LANCZOS)
+        return np.array(image)
+
+    def composite(self, character, background):
+        """Blend the character onto the background wherever it is not near-white"""
+        char = self._to_array(character)
+        # The background array is owned by this call, so it doubles as the output buffer
+        out = self._to_array(background)
+        buffers = self._buffers()
+
+        # Basic brightness mask; a segmentation model would do better
+        cv2.cvtColor(char, cv2.COLOR_RGB2GRAY, dst=buffers['gray'])
+        cv2.threshold(buffers['gray'], self.threshold, 1, cv2.THRESH_BINARY_INV, dst=buffers['mask'])
+
+        if not self.feather:
+            # A 0/1 mask makes the blend a selection: no float copies, the mask broadcasts over channels
+            np.copyto(out, char, where=buffers['mask'].view(np.bool_)[:, :, None])
+            return Image.fromarray(out)
+
+        # Soft edges: out = bg + (char - bg) * alpha, in float32 scratch space
+        alpha, work = buffers['alpha'], buffers['work']
+        kernel = self.feather * 2 + 1
+        np.copyto(alpha, buffers['mask'])
+        cv2.GaussianBlur(alpha, (kernel, kernel), 0, dst=alpha)
+        np.subtract(char, out, out=work, dtype=np.float32)
+        work *= alpha[:, :, None]
+        work += out
+        np.copyto(out, work, casting='unsafe')
+        return Image.fromarray(out)
+
+    def composite_batch(self, pairs):
+        """Composite many (character, background) pairs, reusing the same buffers"""
+        return [self.composite(character, background) for character, background in pairs]
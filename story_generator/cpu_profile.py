@@ -0,0 +1,101 @@
+import logging
+import os
+import torch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# fp32/bf16/int8 tune the eager PyTorch pipeline; openvino runs an exported graph instead
+CPU_MODES = ('fp32', 'bf16', 'int8', 'openvino')
+DEFAULT_CPU_MODE = 'fp32'
+
+
+def configure_threads(num_threads=None):
+    """Size torch's intra-op pool; None keeps the default unless the process is pinned to fewer cores"""
+    if not num_threads and hasattr(os, 'sched_getaffinity'):
+        # Containers and taskset often allow fewer cores than os.cpu_count() reports
+        num_threads = len(os.sched_getaffinity(0))
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    try:
+        # One pipeline runs at a time, so inter-op parallelism only adds contention
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before the first parallel op in the process
+        pass
+    logger.info(f"Torch CPU threads: {torch.get_num_threads()}")
+    return torch.get_num_threads()
+
+
+def bf16_supported():
+    """True when the CPU has native bfloat16 kernels (AVX512-BF16 / AMX)"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except Exception:
+        return False
+
+
+def optimize_pipeline(pipe, mode=DEFAULT_CPU_MODE, channels_last=None, compile_unet=False, shared_weights=False):
+    """
+    Apply a CPU optimisation mode to a loaded diffusers pipeline in place
+
+    Args:
+        pipe: StableDiffusionPipeline already on the CPU in float32
+        mode (str): 'fp32', 'bf16' or 'int8'
+        channels_last (bool): Use NHWC layout for the UNet and VAE convolutions. This copies every
+            conv weight, so memory-mapped weights stop being shared between processes.
+            None: on, except for fp32 pipelines whose weights are shared
+        compile_unet (bool): Wrap the UNet with torch.compile (slow first call, faster steps after)
+        shared_weights (bool): The weights are memory-mapped pages shared between worker processes
+
+    Returns:
+        str: The mode actually applied (bf16 falls back to fp32 on CPUs without support)
+    """
+    if mode == 'bf16' and not bf16_supported():
+        logger.warning("CPU has no native bfloat16 support, using fp32")
+        mode = 'fp32'
+
+    if mode == 'bf16':
+        pipe.to(dtype=torch.bfloat16)
+    elif mode == 'int8':
+        # Dynamic int8 covers the Linear layers (attention, feed-forward, CLIP); convolutions stay fp32
+        for name in ('unet', 'text_encoder'):
+            torch.ao.quantization.quantize_dynamic(
+                getattr(pipe, name), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+
+    if channels_last is None:
+        # bf16 and int8 already copy the weights, so the NHWC copy only costs sharing in fp32
+        channels_last = not (shared_weights and mode == 'fp32')
+    if channels_last:
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+
+    if compile_unet:
+        try:
+            pipe.unet = torch.compile(pipe.unet)
+        except Exception as e:
+            logger.warning(f"torch.compile unavailable, running the UNet eagerly: {e}")
+
+    logger.info(f"CPU profile applied: mode={mode}, channels_last={channels_last}, compile={compile_unet}")
+    return mode
+
+
+def load_openvino_pipeline(model_id, export_dir=None):
+    """
+    Load an OpenVINO-exported Stable Diffusion pipeline (requires optimum[openvino])
+
+    The first load exports the model to export_dir; later loads reuse the exported IR.
+    """
+    from optimum.intel import OVStableDiffusionPipeline
+
+    target = os.path.join(str(export_dir), model_id.replace('/', '--')) if export_dir else None
+    if target and os.path.isdir(target):
+        logger.info(f"Loading OpenVINO pipeline from {target}")
+        return OVStableDiffusionPipeline.from_pretrained(target)
+
+    logger.info(f"Exporting {model_id} to OpenVINO (first run only)...")
+    pipe = OVStableDiffusionPipeline.from_pretrained(model_id, export=True)
+    if target:
+        pipe.save_pretrained(target)
+    return pipe
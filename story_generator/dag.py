@@ -0,0 +1,155 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """A pipeline step that maps named inputs to named outputs"""
+
+    def __init__(self, name, func, inputs, outputs):
+        """
+        Args:
+            name (str): Unique stage name, also used as the persistence key
+            func (callable): Called with the inputs as keyword arguments, returns a dict of outputs
+            inputs (list): Names of values the stage needs
+            outputs (list): Names of values the stage produces
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Stage({self.name}: {self.inputs} -> {self.outputs})"
+
+
+class PipelineError(Exception):
+    """Raised when a stage fails or the graph cannot make progress"""
+
+    def __init__(self, stage, error):
+        super().__init__(f"Stage {stage} failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class PipelineExecutor:
+    """Runs stages as soon as their inputs exist, in parallel where the graph allows"""
+
+    def __init__(self, stages, max_workers=4, store=None, on_event=None):
+        """
+        Args:
+            stages (list): Stage objects; output names must be unique across stages
+            max_workers (int): Maximum number of stages running at once
+            store: Optional object with load() -> {stage: outputs} and save(stage, outputs),
+                used to skip stages that already completed in an earlier run
+            on_event (callable): Optional callback(stage_name, status) for progress reporting;
+                status is 'started', 'completed', 'failed' or 'restored'
+        """
+        self.stages = {stage.name: stage for stage in stages}
+        self.max_workers = max_workers
+        self.store = store
+        self.on_event = on_event
+
+        self._producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self._producers:
+                    raise ValueError(f"Output {output} produced by both {self._producers[output]} and {stage.name}")
+                self._producers[output] = stage.name
+
+    def _required_stages(self, targets, values):
+        """Stages needed to produce the target values (every output if targets is None)"""
+        if targets is None:
+            targets = list(self._producers)
+
+        required = set()
+        pending = list(targets)
+        while pending:
+            value = pending.pop()
+            if value in values:
+                continue
+            stage_name = self._producers.get(value)
+            if stage_name is None or stage_name in required:
+                continue
+            required.add(stage_name)
+            pending.extend(self.stages[stage_name].inputs)
+        return required
+
+    def _emit(self, stage_name, status):
+        if self.on_event:
+            self.on_event(stage_name, status)
+
+    def run(self, values=None, targets=None):
+        """
+        Execute the graph and return all known values
+
+        Args:
+            values (dict): Initial values (e.g. the user prompt)
+            targets (list): Only run the stages needed for these values
+        """
+        values = dict(values or {})
+        remaining = self._required_stages(targets, values)
+
+        # Resume: reuse outputs persisted by a previous run
+        if self.store is not None:
+            for stage_name, outputs in self.store.load().items():
+                if stage_name in remaining:
+                    values.update(outputs)
+                    remaining.discard(stage_name)
+                    logger.info(f"Stage {stage_name} restored from a previous run")
+                    self._emit(stage_name, 'restored')
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pipeline')
+        running = {}
+        failure = None
+        try:
+            # After a failure no new stages start, but running siblings are waited for and
+            # persisted, so a resumed run does not redo an expensive render that succeeded
+            while (remaining and failure is None) or running:
+                if failure is None:
+                    for stage_name in sorted(remaining):
+                        stage = self.stages[stage_name]
+                        if len(running) < self.max_workers and all(name in values for name in stage.inputs):
+                            kwargs = {name: values[name] for name in stage.inputs}
+                            running[executor.submit(self._run_stage, stage, kwargs)] = stage
+                            remaining.discard(stage_name)
+                            self._emit(stage_name, 'started')
+
+                    if not running:
+                        missing = {name for s in remaining for name in self.stages[s].inputs if name not in values}
+                        raise PipelineError(', '.join(sorted(remaining)), f"missing inputs {sorted(missing)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        outputs = future.result()
+                    except Exception as e:
+                        self._emit(stage.name, 'failed')
+                        if failure is None:
+                            failure = PipelineError(stage.name, e)
+                            if running:
+                                logger.info(f"Stage {stage.name} failed; waiting for {len(running)} running stage(s)")
+                        continue
+
+                    values.update(outputs)
+                    if self.store is not None:
+                        self.store.save(stage.name, outputs)
+                    self._emit(stage.name, 'completed')
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if failure is not None:
+            raise failure
+        return values
+
+    def _run_stage(self, stage, kwargs):
+        start = time.perf_counter()
+        result = stage.func(**kwargs) or {}
+        missing = [name for name in stage.outputs if name not in result]
+        if missing:
+            raise ValueError(f"Stage {stage.name} did not produce {missing}")
+        logger.info(f"Stage {stage.name} completed in {time.perf_counter() - start:.2f}s")
+        return {name: result[name] for name in stage.outputs}
@@ -4,7 +4,7 @@ from .models import StoryGeneration
 class StoryPromptForm(forms.ModelForm):
     class Meta:
         model = StoryGeneration
-        fields = ['user_prompt', 'audio_file']
+        fields = ['user_prompt', 'audio_file', 'quality', 'fresh_output']
         widgets = {
             'user_prompt': forms.Textarea(attrs={
                 'class': 'form-control',
@@ -14,6 +14,12 @@ class StoryPromptForm(forms.ModelForm):
             'audio_file': forms.FileInput(attrs={
                 'class': 'form-control',
                 'accept': 'audio/*'
+            }),
+            'quality': forms.Select(attrs={
+                'class': 'form-select'
+            }),
+            'fresh_output': forms.CheckboxInput(attrs={
+                'class': 'form-check-input'
             })
         }
     
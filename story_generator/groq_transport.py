@@ -0,0 +1,239 @@
+import logging
+import os
+import threading
+import time
+import weakref
+import asyncio
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GROQ_BASE_URL = 'https://api.groq.com/openai/v1'
+
+
+class StreamResponse:
+    """Backend-neutral view of a streaming HTTP response"""
+
+    def __init__(self, status_code, read_text, iter_lines):
+        self.status_code = status_code
+        self._read_text = read_text
+        self._iter_lines = iter_lines
+
+    @property
+    def text(self):
+        return self._read_text()
+
+    def iter_lines(self):
+        for line in self._iter_lines():
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='replace')
+            yield line
+
+
+class GroqTransport:
+    """Shared keep-alive HTTP transport for Groq chat completions"""
+
+    def __init__(self, base_url=None, pool_connections=None, pool_maxsize=None, http2=None):
+        """
+        Args:
+            base_url (str): API root, override to point at a local stub server
+            pool_connections (int): Number of per-host connection pools to keep
+            pool_maxsize (int): Maximum keep-alive connections per host
+            http2 (bool): Use HTTP/2 via httpx when it is installed with h2 support
+        """
+        self.base_url = (base_url or os.getenv('GROQ_BASE_URL', GROQ_BASE_URL)).rstrip('/')
+        self.pool_connections = pool_connections or int(os.getenv('GROQ_POOL_CONNECTIONS', 4))
+        self.pool_maxsize = pool_maxsize or int(os.getenv('GROQ_POOL_MAXSIZE', 16))
+        if http2 is None:
+            http2 = os.getenv('GROQ_HTTP2', 'true').lower() in ('1', 'true', 'yes')
+
+        self._stats_lock = threading.Lock()
+        self._request_count = 0
+        self._total_seconds = 0.0
+        self._last_seconds = None
+
+        self.http2 = http2
+        # httpx.AsyncClient is bound to the event loop it was first used on
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self._client = None
+        if http2:
+            self._client = self._create_http2_client()
+        if self._client is None:
+            self._client = self._create_session()
+            self.protocol = 'HTTP/1.1'
+
+    def _create_session(self):
+        """Create a requests session with a sized keep-alive pool"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=False
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _create_http2_client(self):
+        """Create an httpx HTTP/2 client if httpx and h2 are installed"""
+        try:
+            import httpx
+            import h2  # noqa: F401
+        except ImportError:
+            return None
+
+        self.protocol = 'HTTP/2'
+        return httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=self.pool_connections * self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize
+            )
+        )
+
+    def post(self, path, headers=None, json=None, timeout=60):
+        """POST to the API and record the call latency"""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        start = time.perf_counter()
+        try:
+            return self._send(url, headers, json, timeout)
+        finally:
+            self._record(path, time.perf_counter() - start)
+
+    @contextmanager
+    def stream(self, path, headers=None, json=None, timeout=60):
+        """POST and yield a response whose body is read line by line as it arrives"""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        start = time.perf_counter()
+        try:
+            if isinstance(self._client, requests.Session):
+                response = self._client.post(url, headers=headers, json=json, timeout=timeout, stream=True)
+                try:
+                    yield StreamResponse(
+                        response.status_code,
+                        lambda: response.text,
+                        lambda: response.iter_lines(decode_unicode=True)
+                    )
+                finally:
+                    response.close()
+            else:
+                import httpx
+                try:
+                    with self._client.stream('POST', url, headers=headers, json=json, timeout=timeout) as response:
+                        yield StreamResponse(
+                            response.status_code,
+                            lambda: response.read().decode('utf-8', errors='replace'),
+                            response.iter_lines
+                        )
+                except httpx.TimeoutException as e:
+                    raise requests.exceptions.Timeout(str(e))
+                except httpx.HTTPError as e:
+                    raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            self._record(path, time.perf_counter() - start)
+
+    async def apost(self, path, headers=None, json=None, timeout=60):
+        """Async POST to the API on a pooled httpx.AsyncClient"""
+        client = self._get_async_client()
+        import httpx
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        start = time.perf_counter()
+        try:
+            return await client.post(url, headers=headers, json=json, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+        finally:
+            self._record(path, time.perf_counter() - start)
+
+    def _get_async_client(self):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("Async Groq calls require httpx. Install it with: pip install httpx")
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            try:
+                import h2  # noqa: F401
+                http2 = self.http2
+            except ImportError:
+                http2 = False
+            client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.pool_connections * self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize
+                )
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _record(self, path, elapsed):
+        with self._stats_lock:
+            self._request_count += 1
+            self._total_seconds += elapsed
+            self._last_seconds = elapsed
+        logger.debug(f"Groq {path} took {elapsed * 1000:.1f}ms over {self.protocol}")
+
+    def _send(self, url, headers, json, timeout):
+        if isinstance(self._client, requests.Session):
+            return self._client.post(url, headers=headers, json=json, timeout=timeout)
+
+        import httpx
+        try:
+            return self._client.post(url, headers=headers, json=json, timeout=timeout)
+        except httpx.TimeoutException as e:
+            # Keep the same exception type for callers regardless of backend
+            raise requests.exceptions.Timeout(str(e))
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(str(e))
+
+    def stats(self):
+        """Return per-call latency figures for this transport"""
+        with self._stats_lock:
+            count = self._request_count
+            return {
+                'protocol': self.protocol,
+                'requests': count,
+                'avg_ms': (self._total_seconds / count * 1000) if count else None,
+                'last_ms': self._last_seconds * 1000 if self._last_seconds is not None else None,
+                'pool_maxsize': self.pool_maxsize,
+            }
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        """Close the async client bound to the running event loop"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """Return the process-wide transport, creating it on first use"""
+    global _default_transport
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = GroqTransport()
+    return _default_transport
+
+
+def set_default_transport(transport):
+    """Replace the process-wide transport, e.g. with one pointing at a stub server"""
+    global _default_transport
+    with _default_transport_lock:
+        _default_transport = transport
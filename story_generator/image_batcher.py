@@ -0,0 +1,98 @@
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# One image to render; seed is required so batched renders stay reproducible.
+# on_preview(image, step, total_steps) receives cheap previews while the image denoises.
+ImageJob = namedtuple('ImageJob', ['prompt', 'negative_prompt', 'seed', 'label', 'on_preview'], defaults=(None,))
+
+
+class MicroBatcher:
+    """Merges image jobs from concurrent callers into batched pipeline calls"""
+
+    def __init__(self, render_batch, max_batch_size=4, max_wait=0.25):
+        """
+        Args:
+            render_batch (callable): render_batch(jobs, **params) -> list of images
+            max_batch_size (int): Largest batch sent to the pipeline
+            max_wait (float): Seconds to wait for more jobs after the first one arrives
+        """
+        self.render_batch = render_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, job, **params):
+        """
+        Queue a job and return a Future resolving to its image
+
+        Only jobs with identical params (size, quality tier, ...) share a batch.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((job, params, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='image-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for one job, then gather more until the batch is full or the window closes"""
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+
+            groups = {}
+            for job, params, future in items:
+                groups.setdefault(tuple(sorted(params.items())), []).append((job, future))
+
+            for params, group in groups.items():
+                jobs = [job for job, _ in group]
+                try:
+                    images = self.render_batch(jobs, **dict(params))
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+
+                self.batches += 1
+                self.images += len(images)
+                logger.info(f"Rendered batch of {len(images)} image(s) with {dict(params)}")
+                for (_, future), image in zip(group, images):
+                    future.set_result(image)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'avg_batch_size': self.images / self.batches if self.batches else None,
+            'max_batch_size': self.max_batch_size,
+            'max_wait': self.max_wait,
+        }
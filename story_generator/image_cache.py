@@ -0,0 +1,119 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_image_key(model_id, prompt, negative_prompt, steps, guidance_scale, width, height, seed, **extra):
+    """Content-addressed key for one diffusion render"""
+    payload = {
+        'model_id': model_id,
+        'prompt': prompt,
+        'negative_prompt': negative_prompt,
+        'steps': steps,
+        'guidance_scale': guidance_scale,
+        'width': width,
+        'height': height,
+        'seed': seed,
+    }
+    payload.update(extra)
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class DiskImageCache:
+    """Size-capped on-disk cache of rendered images with LRU eviction"""
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024, quality=90):
+        """
+        Args:
+            cache_dir (str): Directory holding the cached images
+            max_bytes (int): Total size cap; least recently used files are evicted beyond it
+            quality (int): WebP quality for stored images
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        # Two-level fan-out keeps directories small
+        return os.path.join(self.cache_dir, key[:2], f"{key}.webp")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with Image.open(path) as image:
+                image.load()
+                result = image.convert('RGB')
+            # Touch mtime so eviction sees this entry as recently used
+            os.utime(path, None)
+        except (FileNotFoundError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def set(self, key, image):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, 'WEBP', quality=self.quality, method=4)
+            # Atomic rename so concurrent readers never see partial files
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Image cache write failed: {e}")
+            return
+
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith('.webp'):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_bytes': self.max_bytes,
+            }
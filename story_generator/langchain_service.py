@@ -1,14 +1,20 @@
 import logging
 import os
+import asyncio
 import requests
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
 from langchain.llms.base import LLM
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain.callbacks.manager import CallbackManagerForLLMRun
-from typing import Optional, List, Any
+from langchain.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk
+from typing import Optional, List, Any, Iterator
 from dotenv import load_dotenv
+from .model_health import model_health
+from .groq_transport import get_default_transport
+from .llm_cache import make_cache_key, get_default_cache
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -26,6 +32,10 @@ class GroqLLM(LLM):
     model_name: str = "llama-3.3-70b-versatile"  # Updated to current model
     temperature: float = 0.8
     max_tokens: int = 1000
+    transport: Optional[Any] = None  # Defaults to the shared pooled GroqTransport
+    seed: Optional[int] = None
+    response_cache: Optional[Any] = None  # Defaults to the shared ResponseCache
+    use_response_cache: bool = True
     
     def __init__(self, groq_api_key: str, model_name: str = "llama-3.3-70b-versatile", **kwargs):
         super().__init__(
@@ -47,74 +57,323 @@ class GroqLLM(LLM):
     ) -> str:
         """Call Groq API"""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.groq_api_key}',
-                'Content-Type': 'application/json'
-            }
-            
-            messages = [
-                {
-                    "role": "system", 
-                    "content": "You are a creative storyteller. Generate engaging, family-friendly content based on user prompts. Be descriptive and imaginative."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ]
-            
-            data = {
-                'model': self.model_name,
-                'messages': messages,
-                'max_tokens': kwargs.get('max_tokens', self.max_tokens),
-                'temperature': kwargs.get('temperature', self.temperature),
-                'top_p': 0.9,
-                'stream': False
-            }
+            data = self._build_payload(prompt, **kwargs)
+            cache, cache_key = self._cache_lookup(prompt, data, kwargs)
+            if cache_key and (cached := cache.get(cache_key)) is not None:
+                logger.info("Groq response served from cache")
+                return cached
             
-            response = requests.post(
-                'https://api.groq.com/openai/v1/chat/completions',
-                headers=headers,
+            transport = self.transport or get_default_transport()
+            response = transport.post(
+                'chat/completions',
+                headers=self._build_headers(),
                 json=data,
                 timeout=60
             )
             
-            if response.status_code == 200:
-                result = response.json()
-                content = result['choices'][0]['message']['content']
+            if response.status_code == 429:
+                logger.warning("Groq API rate limit reached, waiting...")
+                time.sleep(2)
+            
+            content = self._parse_response(response)
+            if cache_key:
+                cache.set(cache_key, content)
+            return content
                 
-                # Log token usage if available
-                if 'usage' in result:
-                    usage = result['usage']
-                    logger.info(f"Tokens used: {usage.get('total_tokens', 'N/A')} (prompt: {usage.get('prompt_tokens', 'N/A')}, completion: {usage.get('completion_tokens', 'N/A')})")
+        except requests.exceptions.Timeout:
+            model_health.record_failure(self.model_name, 'timeout')
+            raise Exception("Groq API timeout")
+        except requests.exceptions.RequestException as e:
+            model_health.record_failure(self.model_name, 'error')
+            logger.error(f"Groq API call failed: {e}")
+            raise e
+        except Exception as e:
+            logger.error(f"Groq API call failed: {e}")
+            raise e
+    
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        """Stream completion tokens from the Groq API as they are generated"""
+        try:
+            data = self._build_payload(prompt, stream=True, **kwargs)
+            # Same key as _call, so streamed and blocking requests share cached completions
+            cache, cache_key = self._cache_lookup(prompt, data, kwargs)
+            if cache_key and (cached := cache.get(cache_key)) is not None:
+                logger.info("Groq response served from cache")
+                chunk = GenerationChunk(text=cached)
+                if run_manager:
+                    run_manager.on_llm_new_token(cached, chunk=chunk)
+                yield chunk
+                return
+            
+            tokens = []
+            transport = self.transport or get_default_transport()
+            with transport.stream(
+                'chat/completions',
+                headers=self._build_headers(),
+                json=data,
+                timeout=60
+            ) as response:
+                if response.status_code != 200:
+                    # Raises with the same errors as the non-streaming path
+                    self._parse_response(response)
                 
-                return content.strip()
+                for line in response.iter_lines():
+                    # Server-sent events: "data: {...}" lines, ending with "data: [DONE]"
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    
+                    choices = json.loads(payload).get('choices') or []
+                    token = choices[0].get('delta', {}).get('content') if choices else None
+                    if not token:
+                        continue
+                    
+                    tokens.append(token)
+                    chunk = GenerationChunk(text=token)
+                    if run_manager:
+                        run_manager.on_llm_new_token(token, chunk=chunk)
+                    yield chunk
             
-            elif response.status_code == 429:
-                logger.warning("Groq API rate limit reached, waiting...")
-                time.sleep(2)
-                raise Exception("Rate limit exceeded")
+            model_health.record_success(self.model_name)
+            if cache_key and tokens:
+                cache.set(cache_key, ''.join(tokens).strip())
+                
+        except requests.exceptions.Timeout:
+            model_health.record_failure(self.model_name, 'timeout')
+            raise Exception("Groq API timeout")
+        except requests.exceptions.RequestException as e:
+            model_health.record_failure(self.model_name, 'error')
+            logger.error(f"Groq API stream failed: {e}")
+            raise e
+        except Exception as e:
+            logger.error(f"Groq API stream failed: {e}")
+            raise e
+    
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """Call Groq API without blocking the event loop"""
+        try:
+            data = self._build_payload(prompt, **kwargs)
+            cache, cache_key = self._cache_lookup(prompt, data, kwargs)
+            if cache_key and (cached := await cache.aget(cache_key)) is not None:
+                logger.info("Groq response served from cache")
+                return cached
             
-            elif response.status_code == 401:
-                raise Exception("Invalid Groq API key")
+            transport = self.transport or get_default_transport()
+            response = await transport.apost(
+                'chat/completions',
+                headers=self._build_headers(),
+                json=data,
+                timeout=60
+            )
             
-            else:
-                raise Exception(f"Groq API error: {response.status_code} - {response.text}")
+            if response.status_code == 429:
+                logger.warning("Groq API rate limit reached, waiting...")
+                await asyncio.sleep(2)
+            
+            content = self._parse_response(response)
+            if cache_key:
+                await cache.aset(cache_key, content)
+            return content
                 
         except requests.exceptions.Timeout:
+            model_health.record_failure(self.model_name, 'timeout')
             raise Exception("Groq API timeout")
+        except requests.exceptions.RequestException as e:
+            model_health.record_failure(self.model_name, 'error')
+            logger.error(f"Groq API call failed: {e}")
+            raise e
         except Exception as e:
             logger.error(f"Groq API call failed: {e}")
             raise e
+    
+    def _cache_lookup(self, prompt, data, kwargs):
+        """Return (cache, key) for this request, or (None, None) when caching is off"""
+        if not kwargs.get('use_cache', self.use_response_cache):
+            return None, None
+        
+        cache = self.response_cache if self.response_cache is not None else get_default_cache()
+        if cache is None:
+            return None, None
+        
+        key = make_cache_key(
+            data['model'],
+            prompt,
+            data['temperature'],
+            data['max_tokens'],
+            data.get('seed'),
+            response_format=data.get('response_format')
+        )
+        return cache, key
+    
+    def _build_headers(self):
+        return {
+            'Authorization': f'Bearer {self.groq_api_key}',
+            'Content-Type': 'application/json'
+        }
+    
+    def _build_payload(self, prompt, **kwargs):
+        """Build the chat completion request body"""
+        messages = [
+            {
+                "role": "system", 
+                "content": "You are a creative storyteller. Generate engaging, family-friendly content based on user prompts. Be descriptive and imaginative."
+            },
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ]
+        
+        data = {
+            'model': self.model_name,
+            'messages': messages,
+            'max_tokens': kwargs.get('max_tokens', self.max_tokens),
+            'temperature': kwargs.get('temperature', self.temperature),
+            'top_p': 0.9,
+            'stream': kwargs.get('stream', False)
+        }
+        
+        seed = kwargs.get('seed', self.seed)
+        if seed is not None:
+            data['seed'] = seed
+        
+        # e.g. {'type': 'json_object'} for Groq JSON mode
+        if kwargs.get('response_format'):
+            data['response_format'] = kwargs['response_format']
+        
+        return data
+    
+    def _parse_response(self, response):
+        """Extract the completion text, recording model health along the way"""
+        if response.status_code == 200:
+            result = response.json()
+            content = result['choices'][0]['message']['content']
+            
+            # Log token usage if available
+            if 'usage' in result:
+                usage = result['usage']
+                logger.info(f"Tokens used: {usage.get('total_tokens', 'N/A')} (prompt: {usage.get('prompt_tokens', 'N/A')}, completion: {usage.get('completion_tokens', 'N/A')})")
+            
+            model_health.record_success(self.model_name)
+            return content.strip()
+        
+        elif response.status_code == 429:
+            model_health.record_failure(self.model_name, 'rate_limit')
+            raise Exception("Rate limit exceeded")
+        
+        elif response.status_code == 401:
+            model_health.record_failure(self.model_name, 'auth')
+            raise Exception("Invalid Groq API key")
+        
+        else:
+            model_health.record_failure(self.model_name, 'error')
+            raise Exception(f"Groq API error: {response.status_code} - {response.text}")
+
+STORY_TEMPLATE = """Write a creative short story (3-4 paragraphs) based on this prompt:
+
+Prompt: {user_prompt}
+
+Requirements:
+- Create vivid, engaging characters
+- Build an immersive setting with rich details
+- Include conflict and resolution
+- Use descriptive language that brings the scene to life
+- Keep it family-friendly but compelling
+- Make it between 200-400 words
+
+Story:"""
+
+CHARACTER_TEMPLATE = """Based on this story, create a detailed character description for visual art creation:
+
+Story: {story}
+
+Create a comprehensive character description including:
+- Physical appearance (age, build, facial features, hair, eyes)
+- Clothing and accessories (style, colors, materials, details)
+- Facial expression and emotional state
+- Body posture and pose
+- Distinctive features or characteristics
+- Overall aesthetic and style
+
+Focus on visual details that would help an artist create a compelling character illustration.
+
+Character description:"""
+
+BACKGROUND_TEMPLATE = """Based on this story, create a detailed background/setting description for visual art creation:
+
+Story: {story}
+
+Create a comprehensive setting description including:
+- Location and environment type (indoor/outdoor, natural/urban, etc.)
+- Architectural or natural features and details
+- Time of day, weather, and seasonal elements
+- Lighting conditions and atmospheric effects
+- Colors, textures, and materials visible in the scene
+- Mood and atmosphere of the setting
+- Any magical or fantastical elements if applicable
+
+Focus on visual details that would help an artist create a compelling background painting.
+
+Background description:"""
+
+STRUCTURED_TEMPLATE = """Write a creative short story (3-4 paragraphs) based on this prompt, then describe its main character and its setting for visual art creation.
+
+Prompt: {user_prompt}
+
+Story requirements:
+- Create vivid, engaging characters
+- Build an immersive setting with rich details
+- Include conflict and resolution
+- Use descriptive language that brings the scene to life
+- Keep it family-friendly but compelling
+- Make it between 200-400 words
+
+Character description: physical appearance (age, build, facial features, hair, eyes), clothing and accessories, facial expression, body posture and pose, distinctive features and overall aesthetic.
+
+Background description: location and environment type, architectural or natural features, time of day and weather, lighting and atmosphere, colors and textures, mood, and any magical or fantastical elements.
+
+Respond with a single JSON object with exactly these string keys:
+{{"story": "...", "character_description": "...", "background_description": "..."}}"""
+
+STRUCTURED_OUTPUT_KEYS = ('story', 'character_description', 'background_description')
+
+def structured_output_default():
+    """Whether single-call JSON-mode generation is on (GROQ_STRUCTURED_OUTPUT)"""
+    return os.getenv('GROQ_STRUCTURED_OUTPUT', 'false').lower() in ('1', 'true', 'yes')
+
+# Groq models in order of preference; preview models are only used when no production model works
+PRODUCTION_MODELS = ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant', 'gemma2-9b-it']
+PREVIEW_MODELS = ['deepseek-r1-distill-llama-70b', 'qwen/qwen3-32b']
 
 class StoryGenerationService:
-    def __init__(self, groq_api_key=None):
+    def __init__(self, groq_api_key=None, transport=None, structured_output=None):
         """
         Initialize Story Generation Service with Groq API only
         
         Args:
             groq_api_key (str): Your Groq API key. If None, will try to load from .env file
+            transport (GroqTransport): HTTP transport to use. If None, the shared pooled transport is used
+            structured_output (bool): Generate story and both descriptions in one JSON-mode call.
+                If None, read from the GROQ_STRUCTURED_OUTPUT environment variable
         """
+        self.transport = transport
+        if structured_output is None:
+            structured_output = structured_output_default()
+        self.structured_output = structured_output
         # Load API key from .env file if not provided
         self.groq_api_key = groq_api_key or os.getenv('GROQ_API_KEY')
         
@@ -175,37 +434,46 @@ class StoryGenerationService:
             groq_api_key=self.groq_api_key,
             model_name=self.current_model,
             temperature=0.8,
-            max_tokens=1000
+            max_tokens=1000,
+            transport=self.transport
         )
     
     def _test_groq_connection(self):
         """Test Groq API connection and find best available model"""
         # Try production models first, then preview models
-        production_models = ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant', 'gemma2-9b-it']
-        preview_models = ['deepseek-r1-distill-llama-70b', 'qwen/qwen3-32b']
+        production_models = PRODUCTION_MODELS
+        preview_models = PREVIEW_MODELS
         
         all_models = production_models + preview_models
         
         for model in all_models:
+            # Skip models still inside their failure backoff window
+            if model_health.is_down(model):
+                logger.info(f"Skipping model {model}: marked down by health cache")
+                continue
+            
+            # Real traffic already proved this model works, no probe needed
+            if model_health.is_known_good(model):
+                self.current_model = model
+                self.llm = self._initialize_groq_llm()
+                logger.info(f"Using cached healthy model: {model}")
+                return True
+            
             try:
                 # Create test LLM with current model
                 test_llm = GroqLLM(
                     groq_api_key=self.groq_api_key,
                     model_name=model,
-                    max_tokens=10
+                    max_tokens=10,
+                    transport=self.transport
                 )
                 
                 # Test with a simple prompt
-                response = test_llm._call("Test connection", max_tokens=10)
+                response = test_llm._call("Test connection", max_tokens=10, use_cache=False)
                 if response:
                     self.current_model = model
                     # Update main LLM with working model
-                    self.llm = GroqLLM(
-                        groq_api_key=self.groq_api_key,
-                        model_name=model,
-                        temperature=0.8,
-                        max_tokens=1000
-                    )
+                    self.llm = self._initialize_groq_llm()
                     model_type = "Production" if model in production_models else "Preview"
                     logger.info(f"Groq API connected successfully using {model_type} model: {model}")
                     logger.info(f"Model specs: {self.groq_models[model]['description']}")
@@ -220,6 +488,28 @@ class StoryGenerationService:
         
         raise Exception("All Groq models failed. Please check your API key and internet connection.")
     
+    def _ensure_healthy_model(self):
+        """
+        Fail over to the next healthy model when traffic has marked the current one down
+        
+        The service lives for the whole worker process, so this runs before every
+        generation rather than only at start-up. No probe call is made: the next real
+        request reports back to the health cache either way.
+        """
+        if not model_health.is_down(self.current_model):
+            return self.current_model
+        
+        for model in PRODUCTION_MODELS + PREVIEW_MODELS:
+            if model != self.current_model and not model_health.is_down(model):
+                logger.warning(f"Model {self.current_model} is marked down, switching to {model}")
+                self.current_model = model
+                self.llm = self._initialize_groq_llm()
+                break
+        else:
+            # Everything is backing off; the current model is as good a guess as any
+            logger.warning("All Groq models are marked down, keeping the current model")
+        return self.current_model
+    
     def set_model(self, model_name):
         """Manually set a specific model"""
         if model_name not in self.groq_models:
@@ -227,22 +517,21 @@ class StoryGenerationService:
             raise ValueError(f"Model {model_name} not available. Choose from: {available_models}")
         
         try:
-            # Test the model first
-            test_llm = GroqLLM(
-                groq_api_key=self.groq_api_key,
-                model_name=model_name,
-                max_tokens=10
-            )
-            test_response = test_llm._call("Test", max_tokens=10)
-            
-            if test_response:
-                self.current_model = model_name
-                self.llm = GroqLLM(
+            # Test the model first, unless recent traffic already shows it is healthy
+            if model_health.is_known_good(model_name):
+                test_response = True
+            else:
+                test_llm = GroqLLM(
                     groq_api_key=self.groq_api_key,
                     model_name=model_name,
-                    temperature=0.8,
-                    max_tokens=1000
+                    max_tokens=10,
+                    transport=self.transport
                 )
+                test_response = test_llm._call("Test", max_tokens=10, use_cache=False)
+            
+            if test_response:
+                self.current_model = model_name
+                self.llm = self._initialize_groq_llm()
                 logger.info(f"Successfully switched to model: {model_name}")
                 return True
             else:
@@ -258,7 +547,7 @@ class StoryGenerationService:
         preview_models = {}
         
         for model, specs in self.groq_models.items():
-            if model in ['llama-3.3-70b-versatile', 'llama-3.1-8b-instant', 'gemma2-9b-it']:
+            if model in PRODUCTION_MODELS:
                 production_models[model] = specs
             else:
                 preview_models[model] = specs
@@ -269,59 +558,180 @@ class StoryGenerationService:
             'current_model': self.current_model
         }
     
-    def generate_story_and_descriptions(self, user_prompt):
+    def generate_story_and_descriptions(self, user_prompt, use_cache=True):
         """Generate story with character and background descriptions using Groq AI with LangChain"""
         try:
             logger.info("Starting story generation...")
             
+            if self.structured_output:
+                result = self._generate_structured(user_prompt, use_cache)
+                if result:
+                    return result
+                logger.warning("Structured output failed, falling back to separate chains")
+            
             # Generate story using LangChain
-            story = self._generate_story(user_prompt)
+            story = self._generate_story(user_prompt, use_cache)
             logger.info("Story generated")
             
-            # Generate character description using LangChain
-            character_desc = self._generate_character_description(story, user_prompt)
-            logger.info("Character description generated")
+            # Character and background only depend on the story, so run them together
+            character_desc, background_desc = self._generate_descriptions(story, user_prompt, use_cache)
+            logger.info("Character and background descriptions generated")
             
-            # Generate background description using LangChain
-            background_desc = self._generate_background_description(story, user_prompt)
-            logger.info("Background description generated")
-            
-            return {
-                'story': story,
-                'character_description': character_desc,
-                'background_description': background_desc,
-                'model_used': f"groq-{self.current_model}",
-                'groq_model_info': self.groq_models.get(self.current_model)
-            }
+            return self._build_result(story, character_desc, background_desc)
             
         except Exception as e:
             logger.error(f"Error in story generation: {e}")
             raise e
     
-    def _generate_story(self, user_prompt):
-        """Generate story using LangChain with Groq"""
-        story_template = """Write a creative short story (3-4 paragraphs) based on this prompt:
-
-Prompt: {user_prompt}
-
-Requirements:
-- Create vivid, engaging characters
-- Build an immersive setting with rich details
-- Include conflict and resolution
-- Use descriptive language that brings the scene to life
-- Keep it family-friendly but compelling
-- Make it between 200-400 words
-
-Story:"""
+    async def agenerate_story_and_descriptions(self, user_prompt, use_cache=True):
+        """Async version of generate_story_and_descriptions for ASGI views"""
+        try:
+            logger.info("Starting async story generation...")
+            
+            if self.structured_output:
+                result = await self._agenerate_structured(user_prompt, use_cache)
+                if result:
+                    return result
+                logger.warning("Structured output failed, falling back to separate chains")
+            
+            story = await self._agenerate_story(user_prompt, use_cache)
+            logger.info("Story generated")
+            
+            character_desc, background_desc = await self._agenerate_descriptions(story, user_prompt, use_cache)
+            logger.info("Character and background descriptions generated")
+            
+            return self._build_result(story, character_desc, background_desc)
+            
+        except Exception as e:
+            logger.error(f"Error in async story generation: {e}")
+            raise e
+    
+    def stream_story(self, user_prompt, use_cache=True, on_text=None):
+        """
+        Generate the story, streaming tokens from Groq as they arrive
+        
+        Args:
+            on_text (callable): Called with the raw story text so far after each token
         
+        Returns:
+            str: The cleaned story, the same text _generate_story returns
+        """
+        self._ensure_healthy_model()
+        parts = []
+        for token in self.llm.stream(STORY_TEMPLATE.format(user_prompt=user_prompt), use_cache=use_cache):
+            parts.append(token)
+            if on_text is not None:
+                on_text(''.join(parts))
+        
+        return self._clean_generated_text(''.join(parts))
+    
+    def _generate_structured(self, user_prompt, use_cache=True):
+        """Generate story and both descriptions in one JSON-mode call; None if unusable"""
         try:
-            prompt = PromptTemplate(
-                input_variables=["user_prompt"],
-                template=story_template
-            )
+            chain = self._build_structured_chain(use_cache)
+            return self._parse_structured_output(chain.run(user_prompt=user_prompt))
+        except Exception as e:
+            logger.warning(f"Structured generation failed: {e}")
+            return None
+    
+    async def _agenerate_structured(self, user_prompt, use_cache=True):
+        """Async version of _generate_structured"""
+        try:
+            chain = self._build_structured_chain(use_cache)
+            return self._parse_structured_output(await chain.arun(user_prompt=user_prompt))
+        except Exception as e:
+            logger.warning(f"Structured generation failed: {e}")
+            return None
+    
+    def _build_structured_chain(self, use_cache=True):
+        chain = self._build_chain(STRUCTURED_TEMPLATE, ["user_prompt"], use_cache)
+        # Room for the story plus two descriptions in one completion
+        chain.llm_kwargs.update({'response_format': {'type': 'json_object'}, 'max_tokens': 2500})
+        return chain
+    
+    def _parse_structured_output(self, text):
+        """Validate the JSON response against the expected schema"""
+        try:
+            data = json.loads(text)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Structured output is not valid JSON: {e}")
+            return None
+        
+        if not isinstance(data, dict):
+            logger.warning("Structured output is not a JSON object")
+            return None
+        
+        for key in STRUCTURED_OUTPUT_KEYS:
+            value = data.get(key)
+            if not isinstance(value, str) or not value.strip():
+                logger.warning(f"Structured output missing or empty field: {key}")
+                return None
+        
+        logger.info("Story and descriptions generated in a single call")
+        return self._build_result(
+            self._clean_generated_text(data['story']),
+            self._clean_generated_text(data['character_description']),
+            self._clean_generated_text(data['background_description'])
+        )
+    
+    def _generate_descriptions(self, story, user_prompt, use_cache=True):
+        """Run the character and background chains in parallel threads"""
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='groq-desc')
+        try:
+            character_future = executor.submit(self._generate_character_description, story, user_prompt, use_cache)
+            background_future = executor.submit(self._generate_background_description, story, user_prompt, use_cache)
             
-            # Create LangChain chain
-            chain = LLMChain(llm=self.llm, prompt=prompt)
+            done, pending = wait([character_future, background_future], return_when=FIRST_EXCEPTION)
+            for future in done:
+                if future.exception():
+                    # Drop the other chain; its result is useless without this one
+                    for other in pending:
+                        other.cancel()
+                    raise future.exception()
+            
+            return character_future.result(), background_future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def _agenerate_descriptions(self, story, user_prompt, use_cache=True):
+        """Run the character and background chains concurrently on the event loop"""
+        tasks = [
+            asyncio.ensure_future(self._agenerate_character_description(story, user_prompt, use_cache)),
+            asyncio.ensure_future(self._agenerate_background_description(story, user_prompt, use_cache))
+        ]
+        try:
+            character_desc, background_desc = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        return character_desc, background_desc
+    
+    def _build_result(self, story, character_desc, background_desc):
+        return {
+            'story': story,
+            'character_description': character_desc,
+            'background_description': background_desc,
+            'model_used': f"groq-{self.current_model}",
+            'groq_model_info': self.groq_models.get(self.current_model)
+        }
+    
+    def _build_chain(self, template, input_variables, use_cache=True):
+        """Create a LangChain chain for the given prompt template"""
+        # Every chain-based generation goes through here, so this is where failover happens
+        self._ensure_healthy_model()
+        prompt = PromptTemplate(
+            input_variables=input_variables,
+            template=template
+        )
+        # use_cache=False bypasses the response cache for users who want fresh output
+        return LLMChain(llm=self.llm, prompt=prompt, llm_kwargs={'use_cache': use_cache})
+    
+    def _generate_story(self, user_prompt, use_cache=True):
+        """Generate story using LangChain with Groq"""
+        try:
+            chain = self._build_chain(STORY_TEMPLATE, ["user_prompt"], use_cache)
             result = chain.run(user_prompt=user_prompt)
             
             return self._clean_generated_text(result)
@@ -330,32 +740,10 @@ Story:"""
             logger.error(f"Error generating story: {e}")
             raise e
     
-    def _generate_character_description(self, story, user_prompt):
+    def _generate_character_description(self, story, user_prompt, use_cache=True):
         """Generate character description using LangChain with Groq"""
-        char_template = """Based on this story, create a detailed character description for visual art creation:
-
-Story: {story}
-
-Create a comprehensive character description including:
-- Physical appearance (age, build, facial features, hair, eyes)
-- Clothing and accessories (style, colors, materials, details)
-- Facial expression and emotional state
-- Body posture and pose
-- Distinctive features or characteristics
-- Overall aesthetic and style
-
-Focus on visual details that would help an artist create a compelling character illustration.
-
-Character description:"""
-        
         try:
-            prompt = PromptTemplate(
-                input_variables=["story"],
-                template=char_template
-            )
-            
-            # Create LangChain chain
-            chain = LLMChain(llm=self.llm, prompt=prompt)
+            chain = self._build_chain(CHARACTER_TEMPLATE, ["story"], use_cache)
             result = chain.run(story=story)
             
             return self._clean_generated_text(result)
@@ -364,33 +752,10 @@ Character description:"""
             logger.error(f"Error generating character description: {e}")
             raise e
     
-    def _generate_background_description(self, story, user_prompt):
+    def _generate_background_description(self, story, user_prompt, use_cache=True):
         """Generate background description using LangChain with Groq"""
-        bg_template = """Based on this story, create a detailed background/setting description for visual art creation:
-
-Story: {story}
-
-Create a comprehensive setting description including:
-- Location and environment type (indoor/outdoor, natural/urban, etc.)
-- Architectural or natural features and details
-- Time of day, weather, and seasonal elements
-- Lighting conditions and atmospheric effects
-- Colors, textures, and materials visible in the scene
-- Mood and atmosphere of the setting
-- Any magical or fantastical elements if applicable
-
-Focus on visual details that would help an artist create a compelling background painting.
-
-Background description:"""
-        
         try:
-            prompt = PromptTemplate(
-                input_variables=["story"],
-                template=bg_template
-            )
-            
-            # Create LangChain chain
-            chain = LLMChain(llm=self.llm, prompt=prompt)
+            chain = self._build_chain(BACKGROUND_TEMPLATE, ["story"], use_cache)
             result = chain.run(story=story)
             
             return self._clean_generated_text(result)
@@ -399,6 +764,42 @@ Background description:"""
             logger.error(f"Error generating background description: {e}")
             raise e
     
+    async def _agenerate_story(self, user_prompt, use_cache=True):
+        """Generate story asynchronously"""
+        try:
+            chain = self._build_chain(STORY_TEMPLATE, ["user_prompt"], use_cache)
+            result = await chain.arun(user_prompt=user_prompt)
+            
+            return self._clean_generated_text(result)
+            
+        except Exception as e:
+            logger.error(f"Error generating story: {e}")
+            raise e
+    
+    async def _agenerate_character_description(self, story, user_prompt, use_cache=True):
+        """Generate character description asynchronously"""
+        try:
+            chain = self._build_chain(CHARACTER_TEMPLATE, ["story"], use_cache)
+            result = await chain.arun(story=story)
+            
+            return self._clean_generated_text(result)
+            
+        except Exception as e:
+            logger.error(f"Error generating character description: {e}")
+            raise e
+    
+    async def _agenerate_background_description(self, story, user_prompt, use_cache=True):
+        """Generate background description asynchronously"""
+        try:
+            chain = self._build_chain(BACKGROUND_TEMPLATE, ["story"], use_cache)
+            result = await chain.arun(story=story)
+            
+            return self._clean_generated_text(result)
+            
+        except Exception as e:
+            logger.error(f"Error generating background description: {e}")
+            raise e
+    
     def _clean_generated_text(self, text):
         """Clean and improve generated text"""
         if not text:
@@ -449,21 +850,21 @@ Background description:"""
     
     def create_image_prompts(self, character_desc, background_desc):
         """Create optimized prompts for Stable Diffusion"""
-        # Optimize character prompt for image generation
-        character_prompt = f"{character_desc}, portrait, detailed, high quality, digital art, fantasy style, concept art"
-        
-        # Optimize background prompt  
-        background_prompt = f"{background_desc}, landscape, detailed, high quality, digital art, fantasy style, matte painting"
-        
-        # Clean and limit prompts
-        character_prompt = self._clean_prompt(character_prompt)[:300]
-        background_prompt = self._clean_prompt(background_prompt)[:300]
-        
         return {
-            'character_prompt': character_prompt,
-            'background_prompt': background_prompt
+            'character_prompt': self.create_character_prompt(character_desc),
+            'background_prompt': self.create_background_prompt(background_desc)
         }
     
+    def create_character_prompt(self, character_desc):
+        """Create an optimized Stable Diffusion prompt for the character"""
+        character_prompt = f"{character_desc}, portrait, detailed, high quality, digital art, fantasy style, concept art"
+        return self._clean_prompt(character_prompt)[:300]
+    
+    def create_background_prompt(self, background_desc):
+        """Create an optimized Stable Diffusion prompt for the background"""
+        background_prompt = f"{background_desc}, landscape, detailed, high quality, digital art, fantasy style, matte painting"
+        return self._clean_prompt(background_prompt)[:300]
+    
     def _clean_prompt(self, prompt):
         """Clean prompt for image generation"""
         # Remove problematic words/phrases
@@ -490,7 +891,10 @@ Background description:"""
             'model_type': model_type,
             'specs': self.groq_models[self.current_model],
             'api_status': 'active',
-            'langchain_integration': True
+            'langchain_integration': True,
+            'model_health': model_health.snapshot(),
+            'transport': (self.transport or get_default_transport()).stats(),
+            'response_cache': get_default_cache().stats() if get_default_cache() else None
         }
 
 # Usage example:
@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(model_name, prompt, temperature, max_tokens, seed=None, **extra):
+    """Content-addressed key for a completion request"""
+    payload = {
+        'model': model_name,
+        'prompt': prompt,
+        'temperature': temperature,
+        'max_tokens': max_tokens,
+        'seed': seed,
+    }
+    payload.update(extra)
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class InMemoryLRUBackend:
+    """Size-bounded in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """Disk-backed cache shared by every worker process on the host"""
+
+    def __init__(self, path, max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, last_used REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        with conn:
+            if expires_at is not None and now >= expires_at:
+                conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl if ttl else None, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            # Evict least recently used entries beyond the size bound
+            conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class RedisBackend:
+    """Cache on any Redis-compatible server; eviction is left to the server's maxmemory policy"""
+
+    def __init__(self, url, prefix='llm_cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + '*'):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    """Front end for a cache backend with TTL and hit/miss counters"""
+
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never break generation
+            logger.warning(f"LLM cache read failed: {e}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, ttl=self.ttl)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    async def aget(self, key):
+        """get() for async callers; SQLite and Redis I/O runs off the event loop"""
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self.set, key, value)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else None,
+            'ttl': self.ttl,
+        }
+
+
+def create_cache_from_env():
+    """
+    Build the response cache from environment variables
+
+    GROQ_CACHE_BACKEND: memory (default), sqlite, redis or none
+    GROQ_CACHE_TTL: seconds before an entry expires (default 86400)
+    GROQ_CACHE_MAX_ENTRIES: size bound for memory/sqlite backends
+    GROQ_CACHE_PATH: sqlite file location (default STORY_GENERATOR_LLM_CACHE_PATH, under BASE_DIR)
+    GROQ_CACHE_REDIS_URL: Redis connection URL
+    """
+    backend_name = os.getenv('GROQ_CACHE_BACKEND', 'memory').lower()
+    ttl = float(os.getenv('GROQ_CACHE_TTL', 86400)) or None
+    max_entries = int(os.getenv('GROQ_CACHE_MAX_ENTRIES', 512))
+
+    if backend_name == 'none':
+        return None
+    if backend_name == 'sqlite':
+        # Anchored to the project rather than the worker's working directory, so every process shares one file
+        path = os.getenv('GROQ_CACHE_PATH') or getattr(
+            settings, 'STORY_GENERATOR_LLM_CACHE_PATH', settings.BASE_DIR / 'cache' / 'llm_cache.sqlite3'
+        )
+        backend = SQLiteBackend(str(path), max_entries=max_entries)
+    elif backend_name == 'redis':
+        backend = RedisBackend(os.getenv('GROQ_CACHE_REDIS_URL', 'redis://localhost:6379/1'))
+    else:
+        backend = InMemoryLRUBackend(max_entries=max_entries)
+
+    logger.info(f"LLM response cache: {type(backend).__name__} (ttl={ttl})")
+    return ResponseCache(backend, ttl=ttl)
+
+
+_default_cache = None
+_default_cache_created = False
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """Return the process-wide response cache (None when caching is disabled)"""
+    global _default_cache, _default_cache_created
+    if not _default_cache_created:
+        with _default_cache_lock:
+            if not _default_cache_created:
+                _default_cache = create_cache_from_env()
+                _default_cache_created = True
+    return _default_cache
@@ -0,0 +1,88 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from story_generator.cpu_profile import CPU_MODES
+from story_generator.image_service import ImageGenerationService, CHARACTER_NEGATIVE_PROMPT
+
+BENCHMARK_PROMPT = "A friendly dragon reading a book in a cozy library, storybook illustration"
+
+
+class Command(BaseCommand):
+    help = "Compare seconds per image and peak RSS of the Stable Diffusion CPU modes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', default=['fp32', 'bf16', 'int8'], choices=CPU_MODES)
+        parser.add_argument('--images', type=int, default=3, help="Timed images per mode (after one warm-up)")
+        parser.add_argument('--quality', default='draft', help="Quality tier to render at")
+        parser.add_argument('--compile', action='store_true', help="Also wrap the UNet with torch.compile")
+        parser.add_argument('--child', action='store_true', help="Internal: benchmark one mode and print JSON")
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self._run_mode(options['modes'][0], options)))
+            return
+
+        # Each mode runs in a fresh process so peak RSS is not inherited from the previous one
+        rows = []
+        for mode in options['modes']:
+            self.stderr.write(f"Benchmarking {mode}...")
+            command = [
+                sys.executable, sys.argv[0], 'benchmark_diffusion', '--child',
+                '--modes', mode, '--images', str(options['images']), '--quality', options['quality'],
+            ]
+            if options['compile']:
+                command.append('--compile')
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                rows.append({'requested_mode': mode, 'error': completed.stderr.strip().splitlines()[-1:]})
+                continue
+            rows.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f"{'mode':<10}{'applied':<10}{'load s':>9}{'s/image':>10}{'peak RSS MB':>14}")
+        for row in rows:
+            if 'error' in row:
+                self.stdout.write(f"{row['requested_mode']:<10}failed: {row['error']}")
+                continue
+            self.stdout.write(
+                f"{row['requested_mode']:<10}{row['mode']:<10}{row['load_seconds']:>9.1f}"
+                f"{row['seconds_per_image']:>10.2f}{row['peak_rss_mb']:>14.0f}"
+            )
+
+    def _run_mode(self, mode, options):
+        # Cache and batching off so every image is an actual render
+        with override_settings(
+            STORY_GENERATOR_CPU_MODE=mode,
+            STORY_GENERATOR_TORCH_COMPILE=options['compile'],
+            STORY_GENERATOR_IMAGE_CACHE_DIR=None,
+            STORY_GENERATOR_IMAGE_BATCH_SIZE=1,
+        ):
+            started = time.perf_counter()
+            service = ImageGenerationService()
+            load_seconds = time.perf_counter() - started
+            if not service.model_id:
+                raise RuntimeError("No Stable Diffusion model could be loaded")
+
+            def render(seed):
+                service.generate_images(
+                    [(BENCHMARK_PROMPT, CHARACTER_NEGATIVE_PROMPT, seed)], quality=options['quality']
+                )
+
+            # Warm-up absorbs one-off costs (torch.compile, oneDNN kernel selection)
+            render(0)
+            started = time.perf_counter()
+            for seed in range(1, options['images'] + 1):
+                render(seed)
+            elapsed = time.perf_counter() - started
+
+        return {
+            'requested_mode': mode,
+            'mode': service.cpu_mode,
+            'load_seconds': load_seconds,
+            'seconds_per_image': elapsed / options['images'],
+            # ru_maxrss is reported in kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
@@ -0,0 +1,83 @@
+import json
+import resource
+import subprocess
+import sys
+import time
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from story_generator.audio_decode import SAMPLE_RATE, decode_audio
+from story_generator.audio_service import AudioService
+from story_generator.whisper_backends import BACKENDS
+
+
+class Command(BaseCommand):
+    help = "Compare real-time factor and peak RSS of the Whisper backends and model sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('audio', help="Audio file to transcribe")
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS))
+        parser.add_argument('--sizes', nargs='+', default=['tiny', 'base'])
+        parser.add_argument('--child', action='store_true', help="Internal: benchmark one combination and print JSON")
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self._run(options['audio'], options['backends'][0], options['sizes'][0])))
+            return
+
+        # Each combination runs in a fresh process so peak RSS is not inherited
+        rows = []
+        for backend in options['backends']:
+            for size in options['sizes']:
+                self.stderr.write(f"Benchmarking {backend} / {size}...")
+                completed = subprocess.run(
+                    [sys.executable, sys.argv[0], 'benchmark_whisper', options['audio'], '--child',
+                     '--backends', backend, '--sizes', size],
+                    capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    rows.append({'backend': backend, 'size': size, 'error': completed.stderr.strip()[-200:]})
+                    continue
+                rows.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        self.stdout.write(f"{'backend':<16}{'size':<8}{'load s':>8}{'RTF':>8}{'peak RSS MB':>14}")
+        for row in rows:
+            if 'error' in row:
+                self.stdout.write(f"{row['backend']:<16}{row['size']:<8}failed: {row['error']}")
+                continue
+            self.stdout.write(
+                f"{row['backend']:<16}{row['size']:<8}{row['load_seconds']:>8.1f}"
+                f"{row['rtf']:>8.3f}{row['peak_rss_mb']:>14.0f}"
+            )
+
+    def _run(self, path, backend, size):
+        with open(path, 'rb') as handle:
+            audio_seconds = sum(len(block) for block in decode_audio(File(handle))) / SAMPLE_RATE
+        if not audio_seconds:
+            raise CommandError("The audio file decoded to no samples")
+
+        # In-process transcription so the backend and size under test are the ones measured
+        with override_settings(STORY_GENERATOR_MODEL_IDLE_TIMEOUT=None, STORY_GENERATOR_TRANSCRIPTION_WORKERS=0):
+            started = time.perf_counter()
+            service = AudioService(backend=backend, model_size=size)
+            load_seconds = time.perf_counter() - started
+            if not service.is_audio_supported():
+                raise CommandError(f"{backend} / {size} could not be loaded")
+
+            with open(path, 'rb') as handle:
+                started = time.perf_counter()
+                transcription = service.transcribe_audio(File(handle))
+                elapsed = time.perf_counter() - started
+            if transcription is None:
+                raise CommandError("Transcription failed")
+
+        return {
+            'backend': backend,
+            'size': size,
+            'load_seconds': load_seconds,
+            'audio_seconds': audio_seconds,
+            # Real-time factor: processing time per second of audio (below 1 is faster than real time)
+            'rtf': elapsed / audio_seconds,
+            # ru_maxrss is reported in kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
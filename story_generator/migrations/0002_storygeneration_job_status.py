@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-16 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("story_generator", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storygeneration",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                ],
+                default="completed",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="storygeneration",
+            name="stage",
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AddField(
+            model_name="storygeneration",
+            name="error_message",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="storygeneration",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-16 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("story_generator", "0002_storygeneration_job_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StageResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stage", models.CharField(max_length=50)),
+                ("outputs", models.JSONField(default=dict)),
+                ("completed_at", models.DateTimeField(auto_now=True)),
+                (
+                    "generation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stage_results",
+                        to="story_generator.storygeneration",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("generation", "stage")},
+            },
+        ),
+    ]
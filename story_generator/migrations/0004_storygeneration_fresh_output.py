@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("story_generator", "0003_stageresult"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storygeneration",
+            name="fresh_output",
+            field=models.BooleanField(default=False),
+        ),
+    ]
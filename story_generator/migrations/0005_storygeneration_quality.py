@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("story_generator", "0004_storygeneration_fresh_output"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storygeneration",
+            name="quality",
+            field=models.CharField(
+                choices=[
+                    ("draft", "Draft (fast preview)"),
+                    ("standard", "Standard"),
+                    ("final", "Final (best quality)"),
+                ],
+                default="standard",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-16 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("story_generator", "0006_storygeneration_partial_story"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="storygeneration",
+            name="partial_transcript",
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -0,0 +1,98 @@
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ModelHealthCache:
+    """TTL-bounded record of Groq model availability, fed by real API traffic"""
+
+    def __init__(self, ttl=300, base_backoff=30, max_backoff=900):
+        """
+        Args:
+            ttl (int): Seconds a successful call keeps a model "known good"
+            base_backoff (int): Seconds a model is marked down after its first failure
+            max_backoff (int): Upper bound for the exponential backoff
+        """
+        self.ttl = ttl
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def _entry(self, model):
+        return self._models.setdefault(model, {
+            'last_success': None,
+            'last_failure': None,
+            'last_error': None,
+            'consecutive_failures': 0,
+            'down_until': 0.0,
+        })
+
+    def record_success(self, model):
+        """Mark a model healthy after a successful completion"""
+        with self._lock:
+            entry = self._entry(model)
+            entry['last_success'] = time.monotonic()
+            entry['consecutive_failures'] = 0
+            entry['down_until'] = 0.0
+
+    def record_failure(self, model, reason):
+        """
+        Mark a model down with exponential backoff
+
+        Args:
+            model (str): Groq model name
+            reason (str): One of 'auth', 'rate_limit', 'timeout' or 'error'
+        """
+        with self._lock:
+            entry = self._entry(model)
+            entry['consecutive_failures'] += 1
+            backoff = min(self.base_backoff * 2 ** (entry['consecutive_failures'] - 1), self.max_backoff)
+            now = time.monotonic()
+            entry['last_failure'] = now
+            entry['last_error'] = reason
+            entry['last_success'] = None
+            entry['down_until'] = now + backoff
+        logger.warning(f"Model {model} marked down for {backoff}s ({reason})")
+
+    def is_known_good(self, model):
+        """True if the model succeeded within the TTL and has not failed since"""
+        with self._lock:
+            entry = self._models.get(model)
+            if not entry or entry['last_success'] is None:
+                return False
+            return time.monotonic() - entry['last_success'] < self.ttl
+
+    def is_down(self, model):
+        """True while a failed model is still inside its backoff window"""
+        with self._lock:
+            entry = self._models.get(model)
+            return bool(entry) and time.monotonic() < entry['down_until']
+
+    def snapshot(self):
+        """Return per-model health for status reporting"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    'state': 'down' if now < entry['down_until'] else (
+                        'good' if entry['last_success'] is not None and now - entry['last_success'] < self.ttl
+                        else 'unknown'
+                    ),
+                    'consecutive_failures': entry['consecutive_failures'],
+                    'last_error': entry['last_error'],
+                    'retry_in': max(0.0, entry['down_until'] - now),
+                }
+                for model, entry in self._models.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+
+# Shared by every GroqLLM in the process
+model_health = ModelHealthCache()
@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Only single-file fp32 safetensors weights plus configs/tokenizer files; no .bin, fp16 variants or safety checker
+SAFETENSORS_PATTERNS = ['*.json', '*.txt', '*/diffusion_pytorch_model.safetensors', '*/model.safetensors']
+SAFETENSORS_IGNORE = ['safety_checker/*']
+
+
+class StartupTimings:
+    """Per-component load times for the startup report"""
+
+    def __init__(self):
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._timings[name] = round(seconds, 3)
+        logger.info(f"Loaded {name} in {seconds:.2f}s")
+
+    def report(self):
+        with self._lock:
+            return dict(self._timings)
+
+
+startup_timings = StartupTimings()
+
+
+def _model_dir():
+    return str(getattr(settings, 'STORY_GENERATOR_MODEL_DIR', None) or '') or None
+
+
+def local_snapshot(model_id):
+    """
+    Return a local directory holding the safetensors weights of a Hub model
+
+    The first call downloads into STORY_GENERATOR_MODEL_DIR; later calls resolve it
+    offline, so cold starts make no network round trips.
+    """
+    from huggingface_hub import snapshot_download
+
+    kwargs = {
+        'allow_patterns': SAFETENSORS_PATTERNS,
+        'ignore_patterns': SAFETENSORS_IGNORE,
+        'cache_dir': _model_dir(),
+    }
+    start = time.perf_counter()
+    try:
+        path = snapshot_download(model_id, local_files_only=True, **kwargs)
+    except Exception:
+        logger.info(f"Downloading {model_id} safetensors snapshot (first run only)...")
+        path = snapshot_download(model_id, **kwargs)
+    startup_timings.record(f"{model_id}:snapshot", time.perf_counter() - start)
+    return path
+
+
+def _timed(name, loader):
+    start = time.perf_counter()
+    component = loader()
+    startup_timings.record(name, time.perf_counter() - start)
+    return component
+
+
+def load_diffusion_pipeline(model_id, torch_dtype):
+    """
+    Load a Stable Diffusion pipeline from memory-mapped safetensors
+
+    The UNet, VAE and text encoder load concurrently. safetensors maps the files
+    instead of reading them, so fp32 weights are backed by the OS page cache and
+    shared by every worker process on the host.
+    """
+    from diffusers import StableDiffusionPipeline, UNet2DConditionModel, AutoencoderKL
+    from transformers import CLIPTextModel
+
+    path = local_snapshot(model_id)
+    common = {'torch_dtype': torch_dtype, 'use_safetensors': True, 'low_cpu_mem_usage': True}
+    components = {
+        'unet': lambda: UNet2DConditionModel.from_pretrained(path, subfolder='unet', **common),
+        'vae': lambda: AutoencoderKL.from_pretrained(path, subfolder='vae', **common),
+        'text_encoder': lambda: CLIPTextModel.from_pretrained(path, subfolder='text_encoder', **common),
+    }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(components)) as executor:
+        futures = {
+            name: executor.submit(_timed, f"{model_id}:{name}", loader)
+            for name, loader in components.items()
+        }
+        loaded = {name: future.result() for name, future in futures.items()}
+
+    # Tokenizer and scheduler are small config-only components
+    pipe = StableDiffusionPipeline.from_pretrained(
+        path,
+        **loaded,
+        torch_dtype=torch_dtype,
+        safety_checker=None,
+        requires_safety_checker=False,
+        local_files_only=True
+    )
+    startup_timings.record(f"{model_id}:pipeline", time.perf_counter() - start)
+    return pipe
+
+
+def load_whisper_model(model_size, device='cpu'):
+    """
+    Load a Whisper checkpoint with its weights memory-mapped instead of copied
+
+    Mirrors whisper.load_model, but torch.load(mmap=True) plus assign=True keeps
+    the tensors backed by the checkpoint file, so the pages are shared across processes.
+    """
+    import torch
+    import whisper
+    from whisper.model import ModelDimensions, Whisper
+
+    start = time.perf_counter()
+    download_root = os.path.join(_model_dir(), 'whisper') if _model_dir() else None
+    checkpoint_file = whisper._download(whisper._MODELS[model_size], download_root or os.path.join(
+        os.path.expanduser('~'), '.cache', 'whisper'
+    ), False)
+    checkpoint = torch.load(checkpoint_file, map_location=device, mmap=True, weights_only=True)
+
+    model = Whisper(ModelDimensions(**checkpoint['dims']))
+    model.load_state_dict(checkpoint['model_state_dict'], assign=True)
+    model.set_alignment_heads(whisper._ALIGNMENT_HEADS[model_size])
+    model = model.to(device)
+
+    startup_timings.record(f"whisper-{model_size}", time.perf_counter() - start)
+    return model
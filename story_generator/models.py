@@ -2,15 +2,58 @@ from django.db import models
 import os
 
 class StoryGeneration(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    QUALITY_CHOICES = [
+        ('draft', 'Draft (fast preview)'),
+        ('standard', 'Standard'),
+        ('final', 'Final (best quality)'),
+    ]
+    
     user_prompt = models.TextField()
     story = models.TextField(blank=True)
+    partial_story = models.TextField(blank=True)  # Story text while it is still streaming from Groq
+    partial_transcript = models.TextField(blank=True)  # Voice prompt text while Whisper is still decoding
     character_description = models.TextField(blank=True)
     background_description = models.TextField(blank=True)
     character_image_prompt = models.TextField(blank=True)
     background_image_prompt = models.TextField(blank=True)
     combined_image = models.ImageField(upload_to='generated_images/', blank=True)
     audio_file = models.FileField(upload_to='audio_uploads/', blank=True, null=True)
+    fresh_output = models.BooleanField(default=False)  # Skip cached LLM responses
+    quality = models.CharField(max_length=20, choices=QUALITY_CHOICES, default='standard')
+    seed = models.BigIntegerField(null=True, blank=True)  # Diffusion seed of a fresh_output job, reused on upgrade
     created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_COMPLETED)
+    stage = models.CharField(max_length=50, blank=True)
+    error_message = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
+    
+    def set_progress(self, status=None, stage=None, error_message=None):
+        """Persist job progress without touching the generated content fields"""
+        update_fields = ['updated_at']
+        if status is not None:
+            self.status = status
+            update_fields.append('status')
+        if stage is not None:
+            self.stage = stage
+            update_fields.append('stage')
+        if error_message is not None:
+            self.error_message = error_message
+            update_fields.append('error_message')
+        self.save(update_fields=update_fields)
     
     def delete(self, *args, **kwargs):
         # Clean up files when deleting model instance
@@ -20,4 +63,15 @@ class StoryGeneration(models.Model):
         if self.audio_file:
             if os.path.isfile(self.audio_file.path):
                 os.remove(self.audio_file.path)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        super().delete(*args, **kwargs)
+
+
+class StageResult(models.Model):
+    """Persisted output of one pipeline stage, so failed jobs can resume"""
+    generation = models.ForeignKey(StoryGeneration, on_delete=models.CASCADE, related_name='stage_results')
+    stage = models.CharField(max_length=50)
+    outputs = models.JSONField(default=dict)
+    completed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = [('generation', 'stage')]
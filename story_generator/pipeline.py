@@ -0,0 +1,369 @@
+import logging
+import os
+import random
+import shutil
+import time
+import uuid
+from PIL import Image
+from django.conf import settings
+from .models import StoryGeneration, StageResult
+from .dag import Stage, PipelineExecutor
+from .service_registry import get_story_service, get_image_service, get_audio_service
+from .transcription_cache import lookup_transcription, store_transcription
+from .langchain_service import structured_output_default
+
+logger = logging.getLogger(__name__)
+
+# Value a voice prompt's transcription produces (on the transcription queue when a pool is configured)
+TRANSCRIPTION_TARGETS = ['user_prompt']
+# Values the text half of the pipeline ends with (handed to the diffusion queue)
+TEXT_TARGETS = ['character_prompt', 'background_prompt']
+IMAGE_TARGETS = ['combined_image']
+
+# Pipeline value name -> StoryGeneration field
+MODEL_FIELDS = {
+    'user_prompt': 'user_prompt',
+    'story': 'story',
+    'character_description': 'character_description',
+    'background_description': 'background_description',
+    'character_prompt': 'character_image_prompt',
+    'background_prompt': 'background_image_prompt',
+    'combined_image': 'combined_image',
+}
+# Pipeline value name -> field holding its in-progress text until the stage completes
+PARTIAL_FIELDS = {
+    'user_prompt': 'partial_transcript',
+    'story': 'partial_story',
+}
+PARTIAL_WRITE_INTERVAL = 0.25  # Seconds between saves of streaming text
+
+
+def save_combined_image(story_gen, image_service, character_image, background_image):
+    """Combine character and background images and attach the saved file, replacing any earlier one"""
+    combined_image = image_service.combine_images(character_image, background_image)
+
+    filename = f"combined_{uuid.uuid4().hex}.jpg"
+    image_path = image_service.save_image(combined_image, filename)
+
+    if image_path:
+        previous = story_gen.combined_image
+        story_gen.combined_image = image_path
+        story_gen.save(update_fields=['combined_image', 'updated_at'])
+        # A quality upgrade keeps showing the old render until the row points at the new one
+        if previous and previous.name != image_path:
+            previous.storage.delete(previous.name)
+    return image_path
+
+
+def partial_writer(story_gen, name):
+    """Callback that saves a stage's in-progress text for the status and stream endpoints"""
+    field = PARTIAL_FIELDS[name]
+    last_write = 0.0
+
+    def write(text):
+        nonlocal last_write
+        # Throttled; the complete value is saved when the stage finishes
+        now = time.monotonic()
+        if now - last_write < PARTIAL_WRITE_INTERVAL:
+            return
+        last_write = now
+        setattr(story_gen, field, text)
+        story_gen.save(update_fields=[field, 'updated_at'])
+
+    return write
+
+
+def preview_dir(story_gen):
+    return os.path.join(settings.MEDIA_ROOT, 'previews', str(story_gen.pk))
+
+
+def preview_writer(story_gen, name):
+    """Step-preview callback that overwrites previews/<pk>/<name>.jpg for the result page to poll"""
+    directory = preview_dir(story_gen)
+
+    def write(image, step, total_steps):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}.jpg")
+        tmp_path = f"{path}.tmp"
+        image.save(tmp_path, 'JPEG', quality=70)
+        # Atomic rename so a poll never fetches a half-written file
+        os.replace(tmp_path, path)
+        logger.debug(f"Preview {name} for generation {story_gen.pk}: step {step}/{total_steps}")
+
+    return write
+
+
+def list_previews(story_gen):
+    """Return {name: (relative path, mtime)} for the current previews of a job"""
+    directory = preview_dir(story_gen)
+    previews = {}
+    if os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith('.jpg'):
+                path = os.path.join(directory, filename)
+                previews[filename[:-4]] = (
+                    os.path.join('previews', str(story_gen.pk), filename),
+                    int(os.path.getmtime(path))
+                )
+    return previews
+
+
+class StageResultStore:
+    """
+    Persists stage outputs in StageResult rows; PIL images are written to disk
+
+    Outputs that map to StoryGeneration fields are saved on the job as each stage
+    completes, so the status and stream endpoints see them before the task ends.
+    """
+
+    def __init__(self, story_gen):
+        self.story_gen = story_gen
+        self.image_dir = os.path.join(settings.MEDIA_ROOT, 'pipeline_stages', str(story_gen.pk))
+
+    def load(self):
+        results = {}
+        for result in StageResult.objects.filter(generation=self.story_gen):
+            try:
+                results[result.stage] = {
+                    name: self._decode(value) for name, value in result.outputs.items()
+                }
+            except Exception as e:
+                # A missing intermediate image just means the stage runs again
+                logger.warning(f"Discarding stored result for stage {result.stage}: {e}")
+        return results
+
+    def save(self, stage, outputs):
+        encoded = {name: self._encode(stage, name, value) for name, value in outputs.items()}
+        StageResult.objects.update_or_create(
+            generation=self.story_gen,
+            stage=stage,
+            defaults={'outputs': encoded}
+        )
+
+        fields = []
+        for name, value in outputs.items():
+            if name in MODEL_FIELDS and value:
+                setattr(self.story_gen, MODEL_FIELDS[name], value)
+                fields.append(MODEL_FIELDS[name])
+            if name in PARTIAL_FIELDS:
+                setattr(self.story_gen, PARTIAL_FIELDS[name], '')
+                fields.append(PARTIAL_FIELDS[name])
+        if fields:
+            self.story_gen.save(update_fields=fields + ['updated_at'])
+
+    def clear(self):
+        StageResult.objects.filter(generation=self.story_gen).delete()
+        shutil.rmtree(self.image_dir, ignore_errors=True)
+
+    def _encode(self, stage, name, value):
+        if isinstance(value, Image.Image):
+            os.makedirs(self.image_dir, exist_ok=True)
+            path = os.path.join(self.image_dir, f"{stage}_{name}.png")
+            value.save(path, 'PNG')
+            return {'image': path}
+        return value
+
+    def _decode(self, value):
+        if isinstance(value, dict) and 'image' in value:
+            with Image.open(value['image']) as image:
+                return image.convert('RGB')
+        return value
+
+
+def build_stages(story_gen):
+    """
+    Describe the generation flow as a stage graph
+
+    Services are resolved inside the stage functions, so a task that only runs image
+    stages never builds the Groq client (and needs no API key).
+    """
+    use_cache = not story_gen.fresh_output
+    # Default seeds come from the prompt, so repeated prompts hit the image cache. A fresh
+    # job's random seed is saved, so a quality upgrade re-renders the same composition
+    if story_gen.fresh_output and story_gen.seed is None:
+        story_gen.seed = random.randrange(2 ** 32)
+        story_gen.save(update_fields=['seed', 'updated_at'])
+    seed = story_gen.seed if story_gen.fresh_output else None
+    stages = []
+
+    if story_gen.audio_file:
+        def transcribe(audio_file):
+            key, transcription = lookup_transcription(audio_file)
+            if transcription:
+                logger.info("Transcription served from cache")
+                return {'user_prompt': transcription}
+            # Partial transcripts go to their own field; user_prompt is only set once decoding succeeds
+            transcription = get_audio_service().transcribe_audio(
+                audio_file, on_partial=partial_writer(story_gen, 'user_prompt')
+            )
+            if not transcription:
+                raise Exception("Failed to transcribe audio. Please try again.")
+            store_transcription(key, transcription)
+            return {'user_prompt': transcription}
+
+        stages.append(Stage('transcription', transcribe, ['audio_file'], ['user_prompt']))
+
+    if structured_output_default():
+        # One JSON-mode call produces all three texts
+        stages.append(Stage(
+            'content',
+            lambda user_prompt: get_story_service().generate_story_and_descriptions(user_prompt, use_cache),
+            ['user_prompt'],
+            ['story', 'character_description', 'background_description']
+        ))
+    else:
+        stages += [
+            Stage(
+                'story',
+                # Streamed, so the story page shows tokens while the rest of the job waits
+                lambda user_prompt: {
+                    'story': get_story_service().stream_story(
+                        user_prompt, use_cache, on_text=partial_writer(story_gen, 'story')
+                    )
+                },
+                ['user_prompt'], ['story']
+            ),
+            Stage(
+                'character_description',
+                lambda story, user_prompt: {
+                    'character_description': get_story_service()._generate_character_description(story, user_prompt, use_cache)
+                },
+                ['story', 'user_prompt'], ['character_description']
+            ),
+            Stage(
+                'background_description',
+                lambda story, user_prompt: {
+                    'background_description': get_story_service()._generate_background_description(story, user_prompt, use_cache)
+                },
+                ['story', 'user_prompt'], ['background_description']
+            ),
+        ]
+
+    stages += [
+        Stage(
+            'character_prompt',
+            lambda character_description: {
+                'character_prompt': get_story_service().create_character_prompt(character_description)
+            },
+            ['character_description'], ['character_prompt']
+        ),
+        Stage(
+            'background_prompt',
+            lambda background_description: {
+                'background_prompt': get_story_service().create_background_prompt(background_description)
+            },
+            ['background_description'], ['background_prompt']
+        ),
+        Stage(
+            'images',
+            # Both images in one batched pipeline call, so they share the denoising loop
+            lambda character_prompt, background_prompt: dict(zip(
+                ['character_image', 'background_image'],
+                get_image_service().generate_scene_images(
+                    character_prompt, background_prompt, seed=seed, quality=story_gen.quality,
+                    on_preview={
+                        'character': preview_writer(story_gen, 'character'),
+                        'background': preview_writer(story_gen, 'background'),
+                    }
+                )
+            )),
+            ['character_prompt', 'background_prompt'], ['character_image', 'background_image']
+        ),
+        Stage(
+            'composite',
+            lambda character_image, background_image: {
+                'combined_image': save_combined_image(
+                    story_gen, get_image_service(), character_image, background_image
+                )
+            },
+            ['character_image', 'background_image'], ['combined_image']
+        ),
+    ]
+    return stages
+
+
+def seed_cached_transcription(story_gen):
+    """Complete the transcription stage up front when this exact upload was transcribed before"""
+    try:
+        _, transcription = lookup_transcription(story_gen.audio_file)
+    except Exception as e:
+        logger.warning(f"Transcription cache lookup failed: {e}")
+        return False
+    if not transcription:
+        return False
+
+    # Saved like a completed stage (user_prompt included), so the worker never loads Whisper
+    StageResultStore(story_gen).save('transcription', {'user_prompt': transcription})
+    logger.info(f"Generation {story_gen.pk}: transcription served from cache")
+    return True
+
+
+def initial_values(story_gen):
+    """Values available before any stage runs, taken from the saved model"""
+    if story_gen.audio_file:
+        values = {'audio_file': story_gen.audio_file}
+    else:
+        values = {'user_prompt': story_gen.user_prompt}
+
+    # Fields an earlier task already filled in (e.g. text stages before the diffusion task).
+    # With audio, the stored prompt is only trusted once transcription has replaced it.
+    for name, field in MODEL_FIELDS.items():
+        # The composite is always (re)rendered: a quality upgrade replaces the saved one, and
+        # an interrupted job resumes it from its StageResult
+        if name in ('user_prompt', 'combined_image'):
+            continue
+        if getattr(story_gen, field):
+            values[name] = getattr(story_gen, field)
+    return values
+
+
+def run_pipeline(story_gen, targets=None, on_event=None):
+    """
+    Run (or resume) the stage graph for a StoryGeneration and save the results
+
+    Args:
+        targets (list): Only run the stages needed for these values (all stages if None)
+        on_event (callable): Also called with (stage_name, status) for every executor event
+    """
+    store = StageResultStore(story_gen)
+
+    def report(stage, status):
+        if status == 'started':
+            story_gen.set_progress(stage=stage)
+        if on_event is not None:
+            on_event(stage, status)
+
+    executor = PipelineExecutor(
+        build_stages(story_gen),
+        max_workers=getattr(settings, 'STORY_GENERATOR_PIPELINE_WORKERS', 4),
+        store=store,
+        on_event=report
+    )
+
+    values = executor.run(initial_values(story_gen), targets=targets)
+
+    # Only the content fields: other tasks may be updating status and stage concurrently
+    fields = []
+    for name, field in MODEL_FIELDS.items():
+        if values.get(name):
+            setattr(story_gen, field, values[name])
+            fields.append(field)
+    story_gen.save(update_fields=fields + ['updated_at'])
+
+    if targets is None or targets == IMAGE_TARGETS:
+        # Job finished; intermediate results and previews are no longer needed
+        store.clear()
+        shutil.rmtree(preview_dir(story_gen), ignore_errors=True)
+    return values
+
+
+def transcription_pending(story_gen):
+    """True while a voice prompt still has to be transcribed"""
+    return bool(story_gen.audio_file) and not StageResult.objects.filter(
+        generation=story_gen, stage='transcription'
+    ).exists()
+
+
+def fail(story_gen, error):
+    logger.error(f"Generation {story_gen.pk} failed: {error}")
+    story_gen.set_progress(status=StoryGeneration.STATUS_FAILED, error_message=str(error))
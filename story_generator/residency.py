@@ -0,0 +1,271 @@
+import gc
+import logging
+import threading
+import time
+from django.conf import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ResidencyError(MemoryError):
+    """A model cannot be loaded without exceeding the RAM budget"""
+
+
+def model_bytes(model):
+    """Bytes held by the parameters and buffers of a torch module or diffusers pipeline"""
+    import torch
+
+    if isinstance(model, torch.nn.Module):
+        modules = [model]
+    else:
+        # Diffusers pipelines and wrappers expose their modules as attributes
+        source = getattr(model, 'components', None) or vars(model)
+        modules = [value for value in source.values() if isinstance(value, torch.nn.Module)]
+
+    seen = set()
+    total = 0
+    for module in modules:
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if id(tensor) in seen:
+                continue
+            seen.add(id(tensor))
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class _Resident:
+    def __init__(self, name, load, unload, estimated_bytes, measure):
+        self.name = name
+        self.load = load
+        self.unload = unload
+        self.estimated_bytes = estimated_bytes
+        self.measure = measure
+        self.model = None
+        self.bytes = 0
+        self.reserved = 0  # Budget held while the model is loading
+        self.in_use = 0
+        self.last_used = None
+        self.loads = 0
+        self.evictions = 0
+        self.load_lock = threading.Lock()
+
+
+class ResidencyManager:
+    """Keeps heavy models in RAM within a budget, evicting idle ones in least recently used order"""
+
+    def __init__(self, budget_bytes=None, idle_timeout=None, check_interval=60):
+        """
+        Args:
+            budget_bytes (int): RAM allowed for resident models (None for no limit)
+            idle_timeout (float): Seconds after which an unused model is unloaded (None to keep it)
+            check_interval (float): How often the idle janitor runs
+        """
+        self.budget_bytes = budget_bytes
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self._residents = {}
+        self._lock = threading.Lock()
+        self._janitor = None
+
+    def register(self, name, load, unload=None, estimated_bytes=0, measure=None):
+        """
+        Register a model by name
+
+        Registering a name again replaces its callbacks (e.g. when a service is rebuilt),
+        so later loads and evictions go to the newest owner; a model already resident stays.
+
+        Args:
+            load (callable): Zero-argument loader returning the model
+            unload (callable): Optional hook called with the model after it is evicted
+            estimated_bytes (int): Size used for budgeting until the model has been loaded once
+            measure (callable): Optional size function for models that are not torch modules
+                (e.g. worker processes); re-run on every release, since such sizes change
+        """
+        with self._lock:
+            resident = self._residents.get(name)
+            if resident is None:
+                self._residents[name] = _Resident(name, load, unload, estimated_bytes, measure)
+            else:
+                resident.load = load
+                resident.unload = unload
+                resident.estimated_bytes = estimated_bytes
+                resident.measure = measure
+        self._ensure_janitor()
+
+    def acquire(self, name):
+        """Return the model, loading it (and evicting others) if needed; pair with release()"""
+        resident = self._residents[name]
+        with self._lock:
+            resident.in_use += 1
+        try:
+            with resident.load_lock:
+                if resident.model is None:
+                    self._load(resident)
+                return resident.model
+        except Exception:
+            self.release(name)
+            raise
+
+    def release(self, name):
+        resident = self._residents[name]
+        with self._lock:
+            resident.in_use -= 1
+            resident.last_used = time.monotonic()
+            if resident.measure is not None and resident.model is not None:
+                resident.bytes = self._measure(resident, resident.model)
+
+    def is_resident(self, name):
+        resident = self._residents.get(name)
+        return resident is not None and resident.model is not None
+
+    def evict(self, name):
+        """Unload a model now unless it is in use; returns True if it was unloaded"""
+        with self._lock:
+            resident = self._residents.get(name)
+            if resident is None or resident.model is None or resident.in_use:
+                return False
+            self._evict_locked(resident)
+        gc.collect()
+        return True
+
+    def evict_idle(self):
+        """Unload every model unused for longer than idle_timeout"""
+        if not self.idle_timeout:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            evicted = [
+                resident.name for resident in self._residents.values()
+                if resident.model is not None and not resident.in_use
+                and now - (resident.last_used or now) > self.idle_timeout
+            ]
+            for name in evicted:
+                self._evict_locked(self._residents[name])
+        if evicted:
+            gc.collect()
+            logger.info(f"Evicted idle models: {evicted}")
+        return evicted
+
+    def _load(self, resident):
+        needed = resident.bytes or resident.estimated_bytes
+        with self._lock:
+            self._make_room(needed, resident)
+            # Held until the load ends, so concurrent loads of other models see this one
+            resident.reserved = needed
+
+        try:
+            logger.info(f"Loading resident model {resident.name}")
+            start = time.perf_counter()
+            model = resident.load()
+            measured = self._measure(resident, model)
+        except Exception:
+            with self._lock:
+                resident.reserved = 0
+            raise
+
+        with self._lock:
+            resident.model = model
+            resident.bytes = measured
+            resident.reserved = 0
+            resident.loads += 1
+            resident.last_used = time.monotonic()
+        logger.info(
+            f"Model {resident.name} resident in {time.perf_counter() - start:.2f}s "
+            f"({resident.bytes / 1024 ** 2:.0f} MB)"
+        )
+
+    def _measure(self, resident, model):
+        try:
+            measured = resident.measure(model) if resident.measure is not None else model_bytes(model)
+        except Exception as e:
+            logger.warning(f"Could not measure {resident.name}: {e}")
+            measured = 0
+        return measured or resident.estimated_bytes
+
+    def _make_room(self, needed, loading):
+        """Evict idle models, least recently used first, until needed bytes fit; caller holds _lock"""
+        if self.budget_bytes is None:
+            return
+
+        used = sum(r.bytes if r.model is not None else r.reserved for r in self._residents.values())
+        candidates = sorted(
+            (r for r in self._residents.values() if r.model is not None and not r.in_use and r is not loading),
+            key=lambda r: r.last_used or 0
+        )
+        for resident in candidates:
+            if used + needed <= self.budget_bytes:
+                break
+            used -= resident.bytes
+            self._evict_locked(resident)
+
+        if used + needed > self.budget_bytes:
+            raise ResidencyError(
+                f"{loading.name} needs {needed / 1024 ** 2:.0f} MB but only "
+                f"{(self.budget_bytes - used) / 1024 ** 2:.0f} MB of the model budget is free"
+            )
+        gc.collect()
+
+    def _evict_locked(self, resident):
+        model = resident.model
+        resident.model = None
+        resident.evictions += 1
+        logger.info(f"Evicting model {resident.name}")
+        if resident.unload is not None:
+            try:
+                resident.unload(model)
+            except Exception as e:
+                logger.warning(f"Unload hook for {resident.name} failed: {e}")
+        del model
+
+    def _ensure_janitor(self):
+        if not self.idle_timeout or (self._janitor is not None and self._janitor.is_alive()):
+            return
+        self._janitor = threading.Thread(target=self._run_janitor, name='model-residency', daemon=True)
+        self._janitor.start()
+
+    def _run_janitor(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.evict_idle()
+            except Exception as e:
+                logger.warning(f"Idle eviction failed: {e}")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            models = {
+                r.name: {
+                    'resident': r.model is not None,
+                    'bytes': r.bytes if r.model is not None else 0,
+                    'in_use': r.in_use,
+                    'idle_seconds': round(now - r.last_used, 1) if r.last_used else None,
+                    'loads': r.loads,
+                    'evictions': r.evictions,
+                }
+                for r in self._residents.values()
+            }
+        return {
+            'budget_bytes': self.budget_bytes,
+            'resident_bytes': sum(m['bytes'] for m in models.values()),
+            'evictions': sum(m['evictions'] for m in models.values()),
+            'models': models,
+        }
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_residency_manager():
+    """Return the process-wide residency manager configured from settings"""
+    global _default_manager
+    if _default_manager is None:
+        with _default_manager_lock:
+            if _default_manager is None:
+                _default_manager = ResidencyManager(
+                    budget_bytes=getattr(settings, 'STORY_GENERATOR_MODEL_RAM_BUDGET', None),
+                    idle_timeout=getattr(settings, 'STORY_GENERATOR_MODEL_IDLE_TIMEOUT', None)
+                )
+    return _default_manager
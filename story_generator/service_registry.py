@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ServiceRegistry:
+    """
+    Process-wide registry that loads each heavy service once per worker
+
+    Instances are shared by every thread in the process; services serialise calls
+    into models that keep per-call state (the diffusion pipeline, Whisper's decoder).
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._load_times = {}
+        self._errors = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, factory):
+        """Register a zero-argument factory used to build the service on first use"""
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        """Return the shared service instance, loading it if it is still cold"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"Service {name} is not registered")
+
+        # One lock per service so a slow Stable Diffusion load does not block Whisper
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+
+            logger.info(f"Loading service: {name}")
+            start = time.perf_counter()
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                self._errors[name] = str(e)
+                logger.error(f"Failed to load service {name}: {e}")
+                raise e
+
+            self._load_times[name] = time.perf_counter() - start
+            self._errors.pop(name, None)
+            self._instances[name] = instance
+            logger.info(f"Service {name} loaded in {self._load_times[name]:.2f}s")
+            return instance
+
+    def is_warm(self, name):
+        """Check whether a service has already been loaded in this process"""
+        return name in self._instances
+
+    def warm_up(self, names=None):
+        """Eagerly load the given services (all registered services by default)"""
+        for name in names or list(self._factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"Warm-up of {name} failed: {e}")
+
+    def unload(self, name):
+        """Drop a loaded service so the next get() reloads it"""
+        with self._locks.get(name, self._registry_lock):
+            instance = self._instances.pop(name, None)
+            self._load_times.pop(name, None)
+        # Release model memory now instead of whenever the last reference goes away
+        if hasattr(instance, 'cleanup_models'):
+            instance.cleanup_models()
+        return instance is not None
+
+    def status(self):
+        """Report warm/cold status and load time for every registered service"""
+        return {
+            name: {
+                'state': 'warm' if name in self._instances else 'cold',
+                'load_seconds': self._load_times.get(name),
+                'last_error': self._errors.get(name),
+            }
+            for name in self._factories
+        }
+
+
+def _build_story_service():
+    from .langchain_service import StoryGenerationService
+    return StoryGenerationService()
+
+
+def _build_image_service():
+    from .image_service import ImageGenerationService
+    return ImageGenerationService()
+
+
+def _build_audio_service():
+    from .audio_service import AudioService
+    return AudioService()
+
+
+registry = ServiceRegistry()
+registry.register('story', _build_story_service)
+registry.register('image', _build_image_service)
+registry.register('audio', _build_audio_service)
+
+
+def get_story_service():
+    return registry.get('story')
+
+
+def get_image_service():
+    return registry.get('image')
+
+
+def get_audio_service():
+    return registry.get('audio')
@@ -0,0 +1,121 @@
+import logging
+from celery import shared_task
+from django.conf import settings
+from .models import StoryGeneration
+from . import pipeline
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def transcribe_task(pk):
+    """Transcribe a voice prompt on the 'transcription' queue, then queue the text stages"""
+    story_gen = _unfinished_job(pk)
+    if story_gen is None:
+        return
+    story_gen.set_progress(status=StoryGeneration.STATUS_RUNNING)
+
+    try:
+        pipeline.run_pipeline(story_gen, targets=pipeline.TRANSCRIPTION_TARGETS)
+    except Exception as e:
+        pipeline.fail(story_gen, e)
+        return
+
+    # The stored transcription is restored there instead of running again
+    generate_story_task.delay(pk)
+
+
+@shared_task
+def generate_story_task(pk):
+    """Text stages (transcription, Groq chains); hands the image stages to the diffusion queue"""
+    story_gen = _unfinished_job(pk)
+    if story_gen is None:
+        return
+    story_gen.set_progress(status=StoryGeneration.STATUS_RUNNING)
+
+    # With a single queue the whole graph runs here, so image stages overlap with text stages
+    split = getattr(settings, 'STORY_GENERATOR_DIFFUSION_QUEUE', True)
+    ready = set()
+    dispatched = False
+
+    def hand_off(stage, status):
+        # Both images render in one diffusion task (one batched pipeline call), queued the
+        # moment the second prompt exists rather than when this task returns
+        nonlocal dispatched
+        if split and stage in pipeline.TEXT_TARGETS and status in ('completed', 'restored'):
+            ready.add(stage)
+            if ready == set(pipeline.TEXT_TARGETS) and not dispatched:
+                dispatched = True
+                render_images_task.delay(pk)
+
+    try:
+        pipeline.run_pipeline(story_gen, targets=pipeline.TEXT_TARGETS if split else None, on_event=hand_off)
+    except Exception as e:
+        pipeline.fail(story_gen, e)
+        return
+
+    if not split:
+        _complete(story_gen)
+    elif not dispatched:
+        # Prompts that were already saved before this run produce no stage events
+        render_images_task.delay(pk)
+
+
+@shared_task
+def render_images_task(pk):
+    """Both images (one batched pipeline call) and the composite on the 'diffusion' queue"""
+    story_gen = _unfinished_job(pk)
+    if story_gen is None:
+        return
+
+    try:
+        pipeline.run_pipeline(story_gen, targets=pipeline.IMAGE_TARGETS)
+    except Exception as e:
+        pipeline.fail(story_gen, e)
+        return
+
+    _complete(story_gen)
+
+
+def _unfinished_job(pk):
+    """
+    The job a task should work on, or None once it has completed or failed
+
+    Tasks are acknowledged late, so a message whose worker died after finishing the job is
+    delivered again. Unfinished jobs are safe to rerun: stages saved in StageResult rows are
+    restored instead of recomputed. Retries and upgrades set the job pending before queueing.
+    """
+    story_gen = StoryGeneration.objects.get(pk=pk)
+    if story_gen.is_finished:
+        logger.info(f"Generation {pk} is already {story_gen.status}; ignoring redelivered task")
+        return None
+    return story_gen
+
+
+def _complete(story_gen):
+    story_gen.set_progress(status=StoryGeneration.STATUS_COMPLETED, stage='done', error_message='')
+    logger.info(f"Generation {story_gen.pk} completed")
+
+
+def enqueue_generation(story_gen):
+    """Mark a saved StoryGeneration pending and queue its pipeline (resumes after a failure)"""
+    story_gen.set_progress(status=StoryGeneration.STATUS_PENDING, stage='queued')
+    if getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_WORKERS', 0) and pipeline.transcription_pending(story_gen):
+        # One worker per host owns the Whisper pool, so uploads from every web process batch together
+        transcribe_task.delay(story_gen.pk)
+    else:
+        generate_story_task.delay(story_gen.pk)
+
+
+def enqueue_images(story_gen):
+    """Queue only the image stages for a job whose text and prompts are already saved"""
+    story_gen.set_progress(status=StoryGeneration.STATUS_PENDING, stage='queued')
+    render_images_task.delay(story_gen.pk)
+
+
+def enqueue_upgrade(story_gen, quality='final'):
+    """Re-render the images of a finished job at a higher quality tier, reusing its text and seed"""
+    # The current image stays on the result page; the composite stage deletes it once replaced
+    story_gen.quality = quality
+    story_gen.save(update_fields=['quality'])
+    enqueue_images(story_gen)
@@ -1,3 +1,1052 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from django.core.files import File
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncRequestFactory, SimpleTestCase, override_settings
+from .groq_transport import GroqTransport
+from .langchain_service import (
+    BACKGROUND_TEMPLATE, CHARACTER_TEMPLATE, STORY_TEMPLATE, STRUCTURED_TEMPLATE, GroqLLM, StoryGenerationService,
+)
+from .model_health import ModelHealthCache, model_health
+from .dag import PipelineError, PipelineExecutor, Stage
+from .llm_cache import InMemoryLRUBackend, ResponseCache, SQLiteBackend, create_cache_from_env, make_cache_key
+from .residency import ResidencyError, ResidencyManager, model_bytes
+from .compositing import Compositor
+from .image_batcher import ImageJob, MicroBatcher
+from .image_cache import DiskImageCache, make_image_key
+from .audio_decode import FRAME_SAMPLES, SAMPLE_RATE, iter_windows
+from .vad import VadStats, trim_silence
+from .whisper_backends import OpenAIWhisperBackend
+from .transcription_cache import hash_upload
+from .models import StoryGeneration
+from . import pipeline, tasks, views
 
-# Create your tests here.
+
+class StubGroqHandler(BaseHTTPRequestHandler):
+    """Minimal chat completions endpoint; behaviour is set on the server object"""
+
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so connection reuse is observable
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append({
+            'path': self.path,
+            'body': body,
+            'authorization': self.headers.get('Authorization'),
+            'client_port': self.client_address[1],
+        })
+
+        if self.server.status != 200:
+            self._send(self.server.status, 'application/json', json.dumps({'error': 'stub'}).encode())
+        elif body.get('stream'):
+            events = [
+                f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n"
+                for token in self.server.tokens
+            ]
+            self._send(200, 'text/event-stream', (''.join(events) + 'data: [DONE]\n\n').encode())
+        else:
+            payload = {'choices': [{'message': {'content': f"  {self.server.reply}  "}}]}
+            self._send(200, 'application/json', json.dumps(payload).encode())
+
+    def _send(self, status, content_type, data):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GroqTransportStubServerTests(SimpleTestCase):
+    """The transport and GroqLLM pointed at a local stub server instead of api.groq.com"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGroqHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/openai/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests = []
+        self.server.status = 200
+        self.server.reply = 'Once upon a time'
+        self.server.tokens = ['Once', ' upon', ' a time']
+        self.transport = GroqTransport(base_url=self.base_url, http2=False)
+        self.addCleanup(self.transport.close)
+
+    def _llm(self):
+        return GroqLLM(
+            groq_api_key='test-key',
+            model_name='stub-model',
+            transport=self.transport,
+            use_response_cache=False
+        )
+
+    def test_post_reaches_stub_and_records_latency(self):
+        response = self.transport.post('chat/completions', json={'model': 'stub-model'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests[0]['path'], '/openai/v1/chat/completions')
+        stats = self.transport.stats()
+        self.assertEqual(stats['protocol'], 'HTTP/1.1')
+        self.assertEqual(stats['requests'], 1)
+        self.assertIsNotNone(stats['last_ms'])
+
+    def test_sequential_requests_reuse_one_connection(self):
+        for _ in range(3):
+            self.transport.post('chat/completions', json={'model': 'stub-model'})
+
+        ports = {request['client_port'] for request in self.server.requests}
+        self.assertEqual(len(ports), 1)
+
+    def test_llm_call_sends_payload_and_strips_reply(self):
+        text = self._llm().invoke('a dragon who bakes bread')
+
+        self.assertEqual(text, 'Once upon a time')
+        request = self.server.requests[0]
+        self.assertEqual(request['authorization'], 'Bearer test-key')
+        self.assertEqual(request['body']['model'], 'stub-model')
+        self.assertEqual(request['body']['messages'][-1]['content'], 'a dragon who bakes bread')
+        self.assertFalse(request['body']['stream'])
+
+    def test_llm_stream_yields_tokens_in_order(self):
+        tokens = list(self._llm().stream('a dragon who bakes bread'))
+
+        self.assertEqual(tokens, ['Once', ' upon', ' a time'])
+        self.assertTrue(self.server.requests[0]['body']['stream'])
+
+    def test_auth_failure_is_reported(self):
+        self.server.status = 401
+
+        with self.assertRaisesMessage(Exception, 'Invalid Groq API key'):
+            self._llm().invoke('a dragon who bakes bread')
+
+
+class MemoryStageStore:
+    """In-memory stand-in for StageResultStore"""
+
+    def __init__(self, results=None):
+        self.results = dict(results or {})
+
+    def load(self):
+        return dict(self.results)
+
+    def save(self, stage, outputs):
+        self.results[stage] = dict(outputs)
+
+
+class PipelineExecutorTests(SimpleTestCase):
+    def _stages(self, calls):
+        def record(name, func):
+            def run(**kwargs):
+                calls.append(name)
+                return func(**kwargs)
+            return run
+
+        return [
+            Stage('story', record('story', lambda prompt: {'story': f"story of {prompt}"}), ['prompt'], ['story']),
+            Stage('character', record('character', lambda story: {'character': f"hero of {story}"}),
+                  ['story'], ['character']),
+            Stage('background', record('background', lambda story: {'background': f"land of {story}"}),
+                  ['story'], ['background']),
+            Stage('scene', record('scene', lambda character, background: {'scene': f"{character} in {background}"}),
+                  ['character', 'background'], ['scene']),
+        ]
+
+    def test_runs_graph_in_dependency_order(self):
+        calls = []
+        values = PipelineExecutor(self._stages(calls)).run({'prompt': 'a fox'})
+
+        self.assertEqual(values['scene'], 'hero of story of a fox in land of story of a fox')
+        self.assertEqual(calls[0], 'story')
+        self.assertEqual(calls[-1], 'scene')
+
+    def test_independent_branches_run_concurrently(self):
+        # Each branch waits for the other; this only completes if they overlap
+        barrier = threading.Barrier(2, timeout=5)
+
+        def branch(name):
+            def run(story):
+                barrier.wait()
+                return {name: story}
+            return run
+
+        stages = [
+            Stage('character', branch('character'), ['story'], ['character']),
+            Stage('background', branch('background'), ['story'], ['background']),
+        ]
+        values = PipelineExecutor(stages, max_workers=2).run({'story': 'tale'})
+
+        self.assertEqual((values['character'], values['background']), ('tale', 'tale'))
+
+    def test_targets_limit_the_stages_run(self):
+        calls = []
+        values = PipelineExecutor(self._stages(calls)).run({'prompt': 'a fox'}, targets=['character'])
+
+        self.assertEqual(sorted(calls), ['character', 'story'])
+        self.assertNotIn('scene', values)
+
+    def test_resume_restores_stored_stages_instead_of_running_them(self):
+        calls = []
+        events = []
+        store = MemoryStageStore({'story': {'story': 'stored story'}})
+
+        values = PipelineExecutor(
+            self._stages(calls), store=store, on_event=lambda stage, status: events.append((stage, status))
+        ).run({'prompt': 'a fox'})
+
+        self.assertNotIn('story', calls)
+        self.assertEqual(values['character'], 'hero of stored story')
+        self.assertIn(('story', 'restored'), events)
+        self.assertEqual(set(store.results), {'story', 'character', 'background', 'scene'})
+
+    def test_failure_persists_running_siblings_before_raising(self):
+        character_done = threading.Event()
+
+        def background(story):
+            raise RuntimeError('render failed')
+
+        def character(story):
+            # Still running when the sibling fails
+            time.sleep(0.2)
+            character_done.set()
+            return {'character': 'hero'}
+
+        stages = [
+            Stage('character', character, ['story'], ['character']),
+            Stage('background', background, ['story'], ['background']),
+            Stage('scene', lambda character, background: {'scene': 'x'}, ['character', 'background'], ['scene']),
+        ]
+        store = MemoryStageStore()
+
+        with self.assertRaises(PipelineError) as raised:
+            PipelineExecutor(stages, max_workers=2, store=store).run({'story': 'tale'})
+
+        self.assertEqual(raised.exception.stage, 'background')
+        self.assertTrue(character_done.is_set())
+        self.assertEqual(store.results, {'character': {'character': 'hero'}})
+
+    def test_missing_inputs_raise(self):
+        stages = [Stage('scene', lambda character: {'scene': character}, ['character'], ['scene'])]
+
+        with self.assertRaisesMessage(PipelineError, "missing inputs ['character']"):
+            PipelineExecutor(stages).run({})
+
+
+class CacheBackendTests(SimpleTestCase):
+    """Behaviour shared by the LLM response cache backends"""
+
+    def _backends(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return [
+            InMemoryLRUBackend(max_entries=2),
+            SQLiteBackend(os.path.join(directory.name, 'cache.sqlite3'), max_entries=2),
+        ]
+
+    def test_get_returns_stored_value(self):
+        for backend in self._backends():
+            with self.subTest(backend=type(backend).__name__):
+                backend.set('a', 'story')
+                self.assertEqual(backend.get('a'), 'story')
+                self.assertIsNone(backend.get('missing'))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for backend in self._backends():
+            with self.subTest(backend=type(backend).__name__):
+                with mock.patch('story_generator.llm_cache.time.time', return_value=1000.0) as now:
+                    backend.set('a', '1')
+                    now.return_value = 1001.0
+                    backend.set('b', '2')
+                    now.return_value = 1002.0
+                    backend.get('a')  # 'b' is now the least recently used
+                    now.return_value = 1003.0
+                    backend.set('c', '3')
+
+                    self.assertEqual(backend.get('a'), '1')
+                    self.assertIsNone(backend.get('b'))
+                    self.assertEqual(backend.get('c'), '3')
+                    self.assertEqual(len(backend), 2)
+
+    def test_entries_expire_after_ttl(self):
+        for backend in self._backends():
+            with self.subTest(backend=type(backend).__name__):
+                with mock.patch('story_generator.llm_cache.time.time', return_value=1000.0) as now:
+                    backend.set('a', 'story', ttl=60)
+                    now.return_value = 1059.0
+                    self.assertEqual(backend.get('a'), 'story')
+                    now.return_value = 1060.0
+                    self.assertIsNone(backend.get('a'))
+
+    def test_sqlite_entries_are_shared_between_instances(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'cache.sqlite3')
+
+        SQLiteBackend(path).set('a', 'story')
+
+        self.assertEqual(SQLiteBackend(path).get('a'), 'story')
+
+
+class ResponseCacheTests(SimpleTestCase):
+    def test_counts_hits_and_misses(self):
+        cache = ResponseCache(InMemoryLRUBackend(), ttl=60)
+        cache.get('a')
+        cache.set('a', 'story')
+        cache.get('a')
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+        self.assertEqual(stats['backend'], 'InMemoryLRUBackend')
+
+    def test_backend_errors_are_treated_as_misses(self):
+        backend = mock.Mock()
+        backend.get.side_effect = OSError('disk gone')
+        backend.set.side_effect = OSError('disk gone')
+        cache = ResponseCache(backend)
+
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'story')
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    async def test_async_access_runs_off_the_event_loop(self):
+        backend = InMemoryLRUBackend()
+        threads = []
+        for name in ('get', 'set'):
+            method = getattr(backend, name)
+
+            def record(*args, method=method, **kwargs):
+                threads.append(threading.get_ident())
+                return method(*args, **kwargs)
+            setattr(backend, name, record)
+        cache = ResponseCache(backend)
+
+        await cache.aset('a', 'story')
+        self.assertEqual(await cache.aget('a'), 'story')
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_sqlite_path_defaults_to_the_setting_not_the_working_directory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cache', 'llm.sqlite3')
+            env = {'GROQ_CACHE_BACKEND': 'sqlite'}
+            with mock.patch.dict(os.environ, env), override_settings(STORY_GENERATOR_LLM_CACHE_PATH=path):
+                os.environ.pop('GROQ_CACHE_PATH', None)
+                cache = create_cache_from_env()
+
+            self.assertEqual(cache.backend.path, path)
+            self.assertTrue(os.path.exists(path))
+
+    def test_key_covers_every_generation_parameter(self):
+        key = make_cache_key('llama', 'prompt', 0.8, 1000)
+
+        self.assertEqual(key, make_cache_key('llama', 'prompt', 0.8, 1000))
+        for other in (
+            make_cache_key('gemma', 'prompt', 0.8, 1000),
+            make_cache_key('llama', 'prompt!', 0.8, 1000),
+            make_cache_key('llama', 'prompt', 0.2, 1000),
+            make_cache_key('llama', 'prompt', 0.8, 500),
+            make_cache_key('llama', 'prompt', 0.8, 1000, seed=7),
+            make_cache_key('llama', 'prompt', 0.8, 1000, response_format={'type': 'json_object'}),
+        ):
+            self.assertNotEqual(key, other)
+
+
+class ResidencyManagerTests(SimpleTestCase):
+    """Budgeting and eviction with small torch modules standing in for diffusion pipelines"""
+
+    def setUp(self):
+        self.loads = []
+        self.unloads = []
+        self.model_size = model_bytes(torch.nn.Linear(16, 16))
+        # Room for two models, not three
+        self.manager = ResidencyManager(budget_bytes=self.model_size * 2 + self.model_size // 2)
+        for name in ('a', 'b', 'c'):
+            self._register(name)
+
+    def _register(self, name, manager=None, tag=''):
+        def load():
+            self.loads.append(name + tag)
+            return torch.nn.Linear(16, 16)
+
+        (manager or self.manager).register(
+            name, load, lambda model: self.unloads.append(name + tag), estimated_bytes=self.model_size
+        )
+
+    def _use(self, name):
+        model = self.manager.acquire(name)
+        self.manager.release(name)
+        return model
+
+    def test_model_stays_resident_between_uses(self):
+        first = self._use('a')
+
+        self.assertIs(self._use('a'), first)
+        self.assertEqual(self.loads, ['a'])
+        self.assertEqual(self.manager.stats()['resident_bytes'], self.model_size)
+
+    def test_least_recently_used_model_is_evicted_to_fit_budget(self):
+        with mock.patch('story_generator.residency.time.monotonic') as now:
+            for tick, name in enumerate(['a', 'b', 'a', 'c']):
+                now.return_value = 1000.0 + tick
+                self._use(name)
+
+        self.assertEqual(self.unloads, ['b'])
+        self.assertTrue(self.manager.is_resident('a'))
+        self.assertFalse(self.manager.is_resident('b'))
+        self.assertTrue(self.manager.is_resident('c'))
+
+    def test_models_in_use_are_never_evicted(self):
+        self.manager.acquire('a')
+        self.manager.acquire('b')
+
+        with self.assertRaises(ResidencyError):
+            self.manager.acquire('c')
+
+        self.assertEqual(self.unloads, [])
+        self.assertFalse(self.manager.evict('a'))
+        self.assertEqual(self.manager.stats()['models']['c']['in_use'], 0)
+
+    def test_concurrent_loads_share_the_budget(self):
+        # Room for one model only
+        manager = ResidencyManager(budget_bytes=self.model_size + self.model_size // 2)
+        loading = threading.Event()
+        finish = threading.Event()
+
+        def slow_load():
+            loading.set()
+            finish.wait(5)
+            return torch.nn.Linear(16, 16)
+
+        manager.register('a', slow_load, estimated_bytes=self.model_size)
+        self._register('b', manager)
+        loader = threading.Thread(target=manager.acquire, args=('a',))
+        loader.start()
+        self.addCleanup(loader.join)
+        self.addCleanup(finish.set)
+        self.assertTrue(loading.wait(5))
+
+        # 'a' is not resident yet, but its bytes are already reserved
+        with self.assertRaises(ResidencyError):
+            manager.acquire('b')
+
+        finish.set()
+        loader.join(5)
+        self.assertTrue(manager.is_resident('a'))
+        self.assertEqual(self.loads, [])
+
+    def test_idle_models_are_unloaded_after_timeout(self):
+        manager = ResidencyManager(idle_timeout=60, check_interval=3600)
+        self._register('a', manager)
+        self._register('b', manager)
+
+        with mock.patch('story_generator.residency.time.monotonic', return_value=1000.0) as now:
+            manager.acquire('a')
+            manager.release('a')
+            manager.acquire('b')  # Held, so never idle
+            now.return_value = 1061.0
+
+            self.assertEqual(manager.evict_idle(), ['a'])
+
+        self.assertEqual(self.unloads, ['a'])
+        self.assertTrue(manager.is_resident('b'))
+
+    def test_reregistering_replaces_callbacks(self):
+        self._use('a')
+        # A rebuilt service registers the same name with its own callbacks
+        self._register('a', tag='-new')
+
+        self.assertTrue(self.manager.evict('a'))
+        self._use('a')
+
+        self.assertEqual(self.unloads, ['a-new'])
+        self.assertEqual(self.loads, ['a', 'a-new'])
+
+    def test_measured_residents_are_resized_on_release(self):
+        # e.g. worker processes, whose RSS grows after they start
+        size = {'bytes': 100}
+        manager = ResidencyManager()
+        manager.register('pool', object, measure=lambda pool: size['bytes'])
+
+        manager.acquire('pool')
+        self.assertEqual(manager.stats()['models']['pool']['bytes'], 100)
+        size['bytes'] = 300
+        manager.release('pool')
+
+        self.assertEqual(manager.stats()['models']['pool']['bytes'], 300)
+
+
+def legacy_combine_images(character_img, background_img):
+    """The float64 blend ImageGenerationService.combine_images used before Compositor"""
+    target_size = (512, 512)
+    char_array = np.array(character_img.resize(target_size, Image.Resampling.LANCZOS))
+    bg_array = np.array(background_img.resize(target_size, Image.Resampling.LANCZOS))
+    char_gray = cv2.cvtColor(char_array, cv2.COLOR_RGB2GRAY)
+    _, mask = cv2.threshold(char_gray, 240, 255, cv2.THRESH_BINARY_INV)
+    mask_3d = np.stack([mask, mask, mask], axis=2) / 255.0
+    return Image.fromarray((char_array * mask_3d + bg_array * (1 - mask_3d)).astype(np.uint8))
+
+
+class CompositorTests(SimpleTestCase):
+    def _image(self, rng, size, white_box=False):
+        pixels = rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+        if white_box:
+            # A near-white region that must show the background through
+            pixels[size[1] // 4:size[1] // 2, size[0] // 4:size[0] // 2] = 250
+        return Image.fromarray(pixels)
+
+    def test_matches_legacy_blend(self):
+        rng = np.random.default_rng(0)
+        compositor = Compositor(size=(512, 512))
+        for size in [(512, 512), (384, 384), (640, 480)]:
+            with self.subTest(size=size):
+                character = self._image(rng, size, white_box=True)
+                background = self._image(rng, size)
+
+                expected = np.array(legacy_combine_images(character, background))
+                actual = np.array(compositor.composite(character, background))
+
+                np.testing.assert_array_equal(actual, expected)
+
+    def test_batch_results_do_not_share_buffers(self):
+        rng = np.random.default_rng(1)
+        pairs = [(self._image(rng, (64, 64), white_box=True), self._image(rng, (64, 64))) for _ in range(3)]
+
+        results = Compositor(size=(64, 64)).composite_batch(pairs)
+
+        # Earlier outputs are untouched by later calls that reuse the scratch buffers
+        for (character, background), result in zip(pairs, results):
+            expected = Compositor(size=(64, 64)).composite(character, background)
+            np.testing.assert_array_equal(np.array(result), np.array(expected))
+
+    def test_feathered_mask_keeps_solid_regions(self):
+        compositor = Compositor(size=(64, 64), feather=2)
+        character = Image.new('RGB', (64, 64), (20, 40, 60))
+        background = Image.new('RGB', (64, 64), (200, 100, 0))
+
+        result = np.array(compositor.composite(character, background))
+
+        # No near-white pixels, so the whole frame is character
+        self.assertTrue((result == (20, 40, 60)).all())
+
+
+def tone(seconds, amplitude=0.5):
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def blocks_of(samples, size):
+    return [samples[start:start + size] for start in range(0, len(samples), size)]
+
+
+class IterWindowsTests(SimpleTestCase):
+    def test_windows_cover_the_input_in_order(self):
+        samples = tone(3.5)
+
+        windows = list(iter_windows(blocks_of(samples, 1000), window_seconds=1, search_seconds=0.25))
+
+        np.testing.assert_array_equal(np.concatenate(windows), samples)
+        self.assertTrue(all(0 < len(window) <= SAMPLE_RATE for window in windows))
+
+    def test_window_is_cut_at_the_quietest_frame(self):
+        samples = tone(2)
+        # A silent frame inside the search region of the first window
+        quiet = SAMPLE_RATE - SAMPLE_RATE // 4 + 5 * FRAME_SAMPLES
+        samples[quiet:quiet + FRAME_SAMPLES] = 0
+
+        first = next(iter_windows(blocks_of(samples, 1000), window_seconds=1, search_seconds=0.25))
+
+        self.assertEqual(len(first), quiet)
+
+
+class TrimSilenceTests(SimpleTestCase):
+    """Default padding is 0.2 s and pauses up to 0.6 s are kept whole"""
+
+    def _trim(self, samples):
+        stats = VadStats()
+        # Blocks that do not line up with the 20 ms frames exercise the carry-over
+        kept = list(trim_silence(blocks_of(samples, 1000), stats))
+        return (np.concatenate(kept) if kept else np.empty(0, dtype=np.float32)), stats
+
+    def test_leading_and_trailing_silence_is_cut_to_padding(self):
+        samples = np.concatenate([silence(1), tone(0.5), silence(1)])
+
+        kept, stats = self._trim(samples)
+
+        self.assertEqual(len(kept), int(0.2 * SAMPLE_RATE) * 2 + len(tone(0.5)))
+        self.assertEqual(stats.total_samples, len(samples))
+        self.assertEqual(stats.kept_samples, len(kept))
+        self.assertEqual(stats.segments, 1)
+
+    def test_short_pauses_are_kept_whole(self):
+        samples = np.concatenate([tone(0.5), silence(0.4), tone(0.5)])
+
+        kept, stats = self._trim(samples)
+
+        np.testing.assert_array_equal(kept, samples)
+        self.assertEqual(stats.segments, 1)
+
+    def test_long_pauses_keep_padding_on_both_sides(self):
+        samples = np.concatenate([tone(0.5), silence(2), tone(0.5)])
+
+        kept, stats = self._trim(samples)
+
+        self.assertEqual(len(kept), len(tone(0.5)) * 2 + int(0.4 * SAMPLE_RATE))
+        self.assertEqual(stats.segments, 2)
+        self.assertAlmostEqual(stats.skipped_seconds, 1.6)
+
+    def test_silence_only_yields_nothing(self):
+        kept, stats = self._trim(silence(2))
+
+        self.assertEqual(len(kept), 0)
+        self.assertEqual(stats.as_dict()['skipped_ratio'], 1.0)
+
+
+class WhisperBatchFallbackTests(SimpleTestCase):
+    """Batched greedy decodes are checked like whisper.transcribe checks its own"""
+
+    def test_failed_windows_are_decoded_again(self):
+        results = [
+            SimpleNamespace(text=' fine ', avg_logprob=-0.3, no_speech_prob=0.1, compression_ratio=1.2),
+            SimpleNamespace(text='la la la la', avg_logprob=-0.3, no_speech_prob=0.1, compression_ratio=3.0),
+            SimpleNamespace(text='mumble', avg_logprob=-1.5, no_speech_prob=0.1, compression_ratio=1.2),
+            SimpleNamespace(text='static', avg_logprob=-1.5, no_speech_prob=0.9, compression_ratio=1.2),
+        ]
+        backend = OpenAIWhisperBackend()
+        model = mock.Mock(device='cpu')
+        model.dims.n_mels = 80
+        windows = [np.zeros(16000, dtype=np.float32) for _ in results]
+
+        with mock.patch('whisper.log_mel_spectrogram', return_value=torch.zeros(80, 3000)), \
+                mock.patch('whisper.decode', return_value=results), \
+                mock.patch.object(backend, 'transcribe', return_value='retried') as transcribe:
+            texts = backend.transcribe_batch(model, windows)
+
+        self.assertEqual(texts, ['fine', 'retried', 'retried', ''])
+        self.assertEqual(transcribe.call_count, 2)
+
+
+class HashUploadTests(SimpleTestCase):
+    def test_closed_file_is_opened_and_closed_again(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'prompt.wav')
+        with open(path, 'wb') as handle:
+            handle.write(b'voice prompt')
+        stored = File(open(path, 'rb'), name=path)
+        stored.close()
+
+        digest = hash_upload(stored)
+
+        self.assertEqual(digest, hash_upload(SimpleUploadedFile('prompt.wav', b'voice prompt')))
+        self.assertTrue(stored.closed)
+
+    def test_open_upload_is_rewound_and_left_open(self):
+        upload = SimpleUploadedFile('prompt.wav', b'voice prompt')
+        upload.read(5)
+
+        hash_upload(upload)
+
+        self.assertFalse(upload.closed)
+        self.assertEqual(upload.read(), b'voice prompt')
+
+
+class StoryEventsTests(SimpleTestCase):
+    """The SSE view reads job rows the workers update; the ORM is replaced by a scripted sequence"""
+
+    def _row(self, status=StoryGeneration.STATUS_RUNNING, stage='story', partial='', story=''):
+        return SimpleNamespace(
+            status=status, stage=stage, error_message='', story=story, partial_story=partial,
+            is_finished=status in (StoryGeneration.STATUS_COMPLETED, StoryGeneration.STATUS_FAILED)
+        )
+
+    def _objects(self, rows):
+        reads = []
+
+        async def aget(pk):
+            reads.append(pk)
+            return rows[min(len(reads), len(rows)) - 1]
+
+        objects = mock.Mock()
+        objects.filter.return_value.aexists = mock.AsyncMock(return_value=True)
+        objects.only.return_value.aget = aget
+        return objects, reads
+
+    @override_settings(STORY_GENERATOR_STREAM_POLL_INTERVAL=0)
+    async def test_tokens_are_sent_before_the_job_finishes(self):
+        objects, reads = self._objects([
+            self._row(partial='Once'),
+            self._row(partial='Once upon'),
+            self._row(status=StoryGeneration.STATUS_COMPLETED, stage='done', story='Once upon a time'),
+        ])
+        request = AsyncRequestFactory().get('/result/7/events/')
+
+        with mock.patch.object(StoryGeneration, 'objects', objects):
+            response = await views.story_events(request, 7)
+            stream = response.streaming_content
+
+            first = (await anext(stream)).decode() + (await anext(stream)).decode()
+            # Delivered after a single read of the row, while the job is still running
+            self.assertEqual(len(reads), 1)
+            self.assertIn('event: stage', first)
+            self.assertIn('event: token\ndata: {"text": "Once"}', first)
+
+            rest = ''.join([chunk.decode() async for chunk in stream])
+
+        self.assertIn('id: 9\nevent: token\ndata: {"text": " upon"}', rest)
+        self.assertIn('"text": "Once upon a time"', rest)
+        self.assertTrue(rest.endswith('\n\n') and 'event: done' in rest)
+
+    async def test_unknown_job_is_404(self):
+        objects = mock.Mock()
+        objects.filter.return_value.aexists = mock.AsyncMock(return_value=False)
+
+        with mock.patch.object(StoryGeneration, 'objects', objects):
+            response = await views.story_events(AsyncRequestFactory().get('/result/1/events/'), 1)
+
+        self.assertEqual(response.status_code, 404)
+
+
+class ImageUpgradeTests(SimpleTestCase):
+    """Re-rendering a finished job at final quality; row saves are stubbed out"""
+
+    def setUp(self):
+        patcher = mock.patch.object(StoryGeneration, 'save')
+        self.save = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _render_seed(self, story_gen):
+        images = next(stage for stage in pipeline.build_stages(story_gen) if stage.name == 'images')
+        image_service = mock.Mock(**{'generate_scene_images.return_value': ('character', 'background')})
+        with mock.patch.object(pipeline, 'get_image_service', return_value=image_service):
+            images.func(character_prompt='a fox', background_prompt='a river')
+        return image_service.generate_scene_images.call_args.kwargs['seed']
+
+    def test_fresh_output_seed_is_kept_for_the_upgrade(self):
+        story_gen = StoryGeneration(pk=3, user_prompt='a fox', fresh_output=True, quality='draft')
+
+        draft_seed = self._render_seed(story_gen)
+        story_gen.quality = 'final'
+
+        self.assertIsNotNone(draft_seed)
+        self.assertEqual(story_gen.seed, draft_seed)
+        self.assertEqual(self._render_seed(story_gen), draft_seed)
+
+    def test_default_jobs_leave_the_seed_to_the_prompt(self):
+        self.assertIsNone(self._render_seed(StoryGeneration(pk=3, user_prompt='a fox')))
+
+    def test_new_composite_replaces_the_old_file(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            old_path = os.path.join(media_root, 'generated_images', 'combined_old.jpg')
+            os.makedirs(os.path.dirname(old_path))
+            Image.new('RGB', (8, 8)).save(old_path)
+            story_gen = StoryGeneration(pk=3, user_prompt='a fox', combined_image='generated_images/combined_old.jpg')
+            image_service = mock.Mock(**{'save_image.return_value': 'generated_images/combined_new.jpg'})
+
+            path = pipeline.save_combined_image(story_gen, image_service, 'character', 'background')
+
+            self.assertEqual(path, 'generated_images/combined_new.jpg')
+            self.assertEqual(story_gen.combined_image.name, path)
+            self.save.assert_called_with(update_fields=['combined_image', 'updated_at'])
+            self.assertFalse(os.path.exists(old_path))
+
+
+class TaskHandOffTests(SimpleTestCase):
+    """Task chaining with Celery running tasks eagerly; the stage graph and job rows are stubbed"""
+
+    def setUp(self):
+        conf = tasks.generate_story_task.app.conf
+        eager = conf.task_always_eager
+        conf.task_always_eager = True
+        self.addCleanup(setattr, conf, 'task_always_eager', eager)
+
+        patcher = mock.patch.object(StoryGeneration, 'save')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.story_gen = StoryGeneration(pk=5, user_prompt='a fox')
+        patcher = mock.patch.object(StoryGeneration, 'objects', **{'get.return_value': self.story_gen})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.runs = []
+        patcher = mock.patch.object(pipeline, 'run_pipeline', side_effect=self._run_pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run_pipeline(self, story_gen, targets=None, on_event=None):
+        self.runs.append(targets)
+        if on_event is not None:
+            for stage in targets or []:
+                on_event(stage, 'completed')
+
+    @override_settings(STORY_GENERATOR_DIFFUSION_QUEUE=True, STORY_GENERATOR_TRANSCRIPTION_WORKERS=0)
+    def test_text_task_hands_the_images_to_one_diffusion_task(self):
+        with mock.patch.object(tasks.render_images_task, 'delay', wraps=tasks.render_images_task.delay) as delay:
+            tasks.enqueue_generation(self.story_gen)
+
+        delay.assert_called_once_with(5)
+        self.assertEqual(self.runs, [pipeline.TEXT_TARGETS, pipeline.IMAGE_TARGETS])
+        self.assertEqual((self.story_gen.status, self.story_gen.stage), (StoryGeneration.STATUS_COMPLETED, 'done'))
+
+    @override_settings(STORY_GENERATOR_TRANSCRIPTION_WORKERS=2)
+    def test_voice_prompts_are_transcribed_first_when_workers_are_configured(self):
+        with mock.patch.object(pipeline, 'transcription_pending', return_value=True):
+            tasks.enqueue_generation(self.story_gen)
+
+        self.assertEqual(self.runs[0], pipeline.TRANSCRIPTION_TARGETS)
+        self.assertEqual(self.story_gen.status, StoryGeneration.STATUS_COMPLETED)
+
+    def test_redelivered_tasks_leave_finished_jobs_alone(self):
+        for status in (StoryGeneration.STATUS_COMPLETED, StoryGeneration.STATUS_FAILED):
+            self.story_gen.status = status
+            for task in (tasks.transcribe_task, tasks.generate_story_task, tasks.render_images_task):
+                task.delay(5)
+
+        self.assertEqual(self.runs, [])
+
+
+class ModelHealthCacheTests(SimpleTestCase):
+    def test_success_is_known_good_until_ttl(self):
+        health = ModelHealthCache(ttl=60)
+        with mock.patch('story_generator.model_health.time.monotonic', return_value=1000.0) as now:
+            health.record_success('llama')
+            now.return_value = 1059.0
+            self.assertTrue(health.is_known_good('llama'))
+            now.return_value = 1060.0
+            self.assertFalse(health.is_known_good('llama'))
+        self.assertFalse(health.is_known_good('unknown'))
+
+    def test_failures_back_off_exponentially_up_to_the_cap(self):
+        health = ModelHealthCache(base_backoff=30, max_backoff=100)
+        with mock.patch('story_generator.model_health.time.monotonic', return_value=1000.0) as now:
+            windows = []
+            for _ in range(4):
+                health.record_failure('llama', 'rate_limit')
+                windows.append(health.snapshot()['llama']['retry_in'])
+            self.assertEqual(windows, [30, 60, 100, 100])
+
+            self.assertTrue(health.is_down('llama'))
+            now.return_value = 1100.0
+            self.assertFalse(health.is_down('llama'))
+
+    def test_success_resets_the_backoff(self):
+        health = ModelHealthCache(base_backoff=30)
+        with mock.patch('story_generator.model_health.time.monotonic', return_value=1000.0):
+            health.record_failure('llama', 'timeout')
+            health.record_failure('llama', 'timeout')
+            health.record_success('llama')
+            self.assertFalse(health.is_down('llama'))
+            health.record_failure('llama', 'timeout')
+            self.assertEqual(health.snapshot()['llama']['retry_in'], 30)
+
+
+class ModelFailoverTests(SimpleTestCase):
+    def setUp(self):
+        model_health.clear()
+        self.addCleanup(model_health.clear)
+        # Known good, so construction needs no probe request
+        model_health.record_success('llama-3.3-70b-versatile')
+        self.service = StoryGenerationService(groq_api_key='test-key', transport=mock.Mock(), structured_output=False)
+
+    def test_switches_away_from_a_model_marked_down_by_traffic(self):
+        model_health.record_failure('llama-3.3-70b-versatile', 'rate_limit')
+
+        self.assertEqual(self.service._ensure_healthy_model(), 'llama-3.1-8b-instant')
+        self.assertEqual(self.service.llm.model_name, 'llama-3.1-8b-instant')
+
+    def test_healthy_model_is_kept(self):
+        self.assertEqual(self.service._ensure_healthy_model(), 'llama-3.3-70b-versatile')
+
+
+class StructuredOutputTests(SimpleTestCase):
+    """Single-call JSON generation and its fallback, with chain output stubbed per prompt template"""
+
+    VALID = json.dumps({
+        'story': 'A lighthouse keeper befriends a storm.',
+        'character_description': 'An old keeper in a yellow raincoat.',
+        'background_description': 'A rocky island lighthouse at night.',
+    })
+
+    def setUp(self):
+        model_health.clear()
+        self.addCleanup(model_health.clear)
+        model_health.record_success('llama-3.3-70b-versatile')
+        self.service = StoryGenerationService(groq_api_key='test-key', transport=mock.Mock(), structured_output=True)
+        self.templates = []
+
+    def _stub_chains(self, structured_output):
+        outputs = {
+            STRUCTURED_TEMPLATE: structured_output,
+            STORY_TEMPLATE: 'A fox crosses the frozen river at dawn.',
+            CHARACTER_TEMPLATE: 'A small red fox with a torn ear.',
+            BACKGROUND_TEMPLATE: 'A wide frozen river under a pink sky.',
+        }
+
+        def build_chain(template, input_variables, use_cache=True):
+            self.templates.append(template)
+            return mock.Mock(llm_kwargs={}, **{'run.return_value': outputs[template]})
+
+        patcher = mock.patch.object(self.service, '_build_chain', side_effect=build_chain)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_json_fills_every_field_in_one_call(self):
+        self._stub_chains(self.VALID)
+
+        result = self.service.generate_story_and_descriptions('a storm')
+
+        self.assertEqual(result['story'], 'A lighthouse keeper befriends a storm.')
+        self.assertEqual(result['character_description'], 'An old keeper in a yellow raincoat.')
+        self.assertEqual(result['background_description'], 'A rocky island lighthouse at night.')
+        self.assertEqual(self.templates, [STRUCTURED_TEMPLATE])
+
+    def test_invalid_responses_are_rejected(self):
+        missing = json.dumps({'story': 'A story.', 'character_description': 'A fox.'})
+        empty = json.dumps({**json.loads(self.VALID), 'background_description': '  '})
+        for text in ('not json at all', '["a", "list"]', missing, empty, None):
+            with self.subTest(text=text):
+                self.assertIsNone(self.service._parse_structured_output(text))
+
+    def test_unusable_json_falls_back_to_the_separate_chains(self):
+        self._stub_chains('{"story": "A fox crosses the river.')
+
+        result = self.service.generate_story_and_descriptions('a fox')
+
+        self.assertEqual(result['story'], 'A fox crosses the frozen river at dawn.')
+        self.assertEqual(result['character_description'], 'A small red fox with a torn ear.')
+        self.assertEqual(result['background_description'], 'A wide frozen river under a pink sky.')
+        self.assertEqual(self.templates[0], STRUCTURED_TEMPLATE)
+        self.assertCountEqual(self.templates[1:], [STORY_TEMPLATE, CHARACTER_TEMPLATE, BACKGROUND_TEMPLATE])
+
+
+class DiskImageCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache_dir = directory.name
+        self.image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (32, 32, 3), dtype=np.uint8))
+
+    def _key(self, prompt, **overrides):
+        params = dict(prompt=prompt, negative_prompt='blurry', steps=20, guidance_scale=7.5, width=512, height=512, seed=1)
+        params.update(overrides)
+        return make_image_key('sd-1.5', **params)
+
+    def test_key_covers_every_render_parameter(self):
+        key = self._key('hero')
+
+        self.assertEqual(key, self._key('hero'))
+        for overrides in ({'prompt': 'villain'}, {'negative_prompt': ''}, {'steps': 30}, {'guidance_scale': 6.0},
+                          {'width': 384}, {'seed': 2}, {'quality': 'draft'}):
+            self.assertNotEqual(key, self._key(**{'prompt': 'hero', **overrides}))
+        self.assertNotEqual(key, make_image_key('bk-sdm-small', 'hero', 'blurry', 20, 7.5, 512, 512, 1))
+
+    def test_miss_then_hit(self):
+        cache = DiskImageCache(self.cache_dir)
+
+        self.assertIsNone(cache.get(self._key('hero')))
+        cache.set(self._key('hero'), self.image)
+        cached = cache.get(self._key('hero'))
+
+        self.assertEqual((cached.size, cached.mode), ((32, 32), 'RGB'))
+        self.assertEqual((cache.stats()['hits'], cache.stats()['misses']), (1, 1))
+
+    def test_least_recently_used_image_is_evicted_past_the_size_cap(self):
+        cache = DiskImageCache(self.cache_dir, max_bytes=10 ** 9)
+        keys = [self._key(prompt) for prompt in ('a', 'b', 'c')]
+        cache.set(keys[0], self.image)
+        cache.set(keys[1], self.image)
+        for key, mtime in zip(keys[:2], (1000, 2000)):
+            os.utime(cache._path(key), (mtime, mtime))
+        # Reading 'a' makes 'b' the least recently used entry
+        cache.get(keys[0])
+
+        # The same image each time, so every entry has the same size; room for two
+        cache.max_bytes = 2 * os.path.getsize(cache._path(keys[0]))
+        cache.set(keys[2], self.image)
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def _batcher(self, **kwargs):
+        batches = []
+
+        def render(jobs, **params):
+            batches.append(([job.prompt for job in jobs], params))
+            return [f"{job.prompt}@{params.get('size')}" for job in jobs]
+
+        return MicroBatcher(render, **kwargs), batches
+
+    def _job(self, prompt):
+        return ImageJob(prompt, 'blurry', 1, prompt)
+
+    def test_jobs_inside_the_wait_window_share_a_batch(self):
+        batcher, batches = self._batcher(max_batch_size=4, max_wait=0.5)
+
+        futures = [batcher.submit(self._job(prompt), size=512) for prompt in ('hero', 'castle')]
+
+        self.assertEqual([future.result(timeout=5) for future in futures], ['hero@512', 'castle@512'])
+        self.assertEqual(batches, [(['hero', 'castle'], {'size': 512})])
+        self.assertEqual(batcher.stats()['avg_batch_size'], 2)
+
+    def test_jobs_after_the_wait_window_get_their_own_batch(self):
+        batcher, batches = self._batcher(max_batch_size=4, max_wait=0.05)
+
+        first = batcher.submit(self._job('hero'), size=512)
+        first.result(timeout=5)
+        second = batcher.submit(self._job('castle'), size=512)
+        second.result(timeout=5)
+
+        self.assertEqual([prompts for prompts, _ in batches], [['hero'], ['castle']])
+
+    def test_batches_are_split_by_params_and_size(self):
+        batcher, batches = self._batcher(max_batch_size=2, max_wait=0.5)
+
+        futures = [
+            batcher.submit(self._job('a'), size=512),
+            batcher.submit(self._job('b'), size=384),
+            batcher.submit(self._job('c'), size=512),
+        ]
+
+        self.assertEqual([future.result(timeout=5) for future in futures], ['a@512', 'b@384', 'c@512'])
+        # The first two fill the batch; a 384 job never shares a call with 512 ones
+        self.assertEqual(batches[0], (['a'], {'size': 512}))
+        self.assertEqual(batches[1], (['b'], {'size': 384}))
+        self.assertEqual(batches[2], (['c'], {'size': 512}))
+
+    def test_render_errors_reach_every_caller_in_the_batch(self):
+        batcher = MicroBatcher(mock.Mock(side_effect=RuntimeError('out of memory')), max_batch_size=2, max_wait=0.5)
+
+        futures = [batcher.submit(self._job(prompt)) for prompt in ('hero', 'castle')]
+
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
@@ -0,0 +1,80 @@
+import hashlib
+import logging
+import threading
+from django.conf import settings
+from .llm_cache import ResponseCache, SQLiteBackend
+from .whisper_backends import create_backend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def hash_upload(audio_file):
+    """SHA-256 of an upload, read chunk by chunk so large files are never held in memory"""
+    digest = hashlib.sha256()
+    if getattr(audio_file, 'closed', True):
+        # Stored FieldFile: opened for this read only, so no handle is left behind
+        with audio_file.open('rb'):
+            for chunk in audio_file.chunks():
+                digest.update(chunk)
+    else:
+        # Already open (e.g. an upload still in the request): rewound and left open for the caller
+        for chunk in audio_file.chunks():
+            digest.update(chunk)
+        audio_file.seek(0)
+    return digest.hexdigest()
+
+
+def transcription_model_id():
+    """Identifies everything that changes a transcript: backend, model size and VAD settings"""
+    backend = create_backend()
+    if getattr(settings, 'STORY_GENERATOR_VAD_ENABLED', True):
+        vad = f"vad{getattr(settings, 'STORY_GENERATOR_VAD_THRESHOLD_DB', -45.0)}"
+    else:
+        vad = 'novad'
+    return f"{backend.name}:{backend.model_size}:{vad}"
+
+
+_default_cache = None
+_default_cache_created = False
+_default_cache_lock = threading.Lock()
+
+
+def get_transcription_cache():
+    """Return the process-wide transcription cache (None when disabled in settings)"""
+    global _default_cache, _default_cache_created
+    if not _default_cache_created:
+        with _default_cache_lock:
+            if not _default_cache_created:
+                path = getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_CACHE_PATH', None)
+                if path:
+                    # Shared SQLite file: every worker on the host sees the same entries, LRU-evicted
+                    _default_cache = ResponseCache(
+                        SQLiteBackend(
+                            str(path),
+                            max_entries=getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_CACHE_MAX_ENTRIES', 2000)
+                        ),
+                        ttl=getattr(settings, 'STORY_GENERATOR_TRANSCRIPTION_CACHE_TTL', None)
+                    )
+                _default_cache_created = True
+    return _default_cache
+
+
+def lookup_transcription(audio_file):
+    """
+    Check the cache for an upload without loading any model
+
+    Returns:
+        tuple: (cache key, transcription or None); the key is None when caching is disabled
+    """
+    cache = get_transcription_cache()
+    if cache is None:
+        return None, None
+    key = f"{hash_upload(audio_file)}:{transcription_model_id()}"
+    return key, cache.get(key)
+
+
+def store_transcription(key, transcription):
+    cache = get_transcription_cache()
+    if cache is not None and key and transcription:
+        cache.set(key, transcription)
@@ -0,0 +1,230 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class PoolBusy(Exception):
+    """Every queue slot stayed taken for the whole submit timeout (backpressure)"""
+
+
+class TranscriptionTimeout(Exception):
+    """A window was not transcribed within the per-job timeout"""
+
+
+def _worker_main(backend_name, model_size, threads, jobs, results, batch_size, batch_wait):
+    """Worker process: load one model, then transcribe batches of windows until told to stop"""
+    # No django.setup(): settings are read lazily through the inherited DJANGO_SETTINGS_MODULE,
+    # and running the app ready() hooks here would eager-load services (and another pool)
+    import torch
+    from .whisper_backends import create_backend
+
+    torch.set_num_threads(threads)
+    backend = create_backend(backend_name, model_size)
+    model = backend.load()
+    logger.info(f"Transcription worker {os.getpid()} ready ({backend_name}/{model_size}, {threads} threads)")
+
+    stopping = False
+    while not stopping:
+        item = jobs.get()
+        if item is None:
+            break
+        batch = [item]
+        # Gather windows from other uploads that arrive within the batching window
+        deadline = time.monotonic() + batch_wait
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = jobs.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            batch.append(item)
+
+        keys = [key for key, _ in batch]
+        try:
+            texts = backend.transcribe_batch(model, [audio for _, audio in batch])
+        except Exception as e:
+            for key in keys:
+                results.put((key, None, str(e)))
+            continue
+        for key, text in zip(keys, texts):
+            results.put((key, text, None))
+
+
+class TranscriptionPool:
+    """
+    Fixed set of Whisper worker processes fed from a bounded job queue
+
+    Windows from every upload transcribed in the owning process share the workers and
+    are batched together, so it should be owned by one process per host (see
+    AudioService and the 'transcription' Celery queue).
+    """
+
+    def __init__(self, backend_name, model_size, workers=2, max_pending=32, batch_size=4,
+                 batch_wait=0.05, timeout=300, submit_timeout=10):
+        """
+        Args:
+            backend_name (str): Whisper backend each worker loads
+            model_size (str): Whisper model size each worker loads
+            workers (int): Number of worker processes (one model each)
+            max_pending (int): Windows queued or in flight before submit() blocks
+            batch_size (int): Windows a worker decodes with one encoder forward
+            batch_wait (float): Seconds a worker waits to fill a batch
+            timeout (float): Seconds before an unfinished window fails with TranscriptionTimeout
+            submit_timeout (float): Seconds submit() waits for a free slot before raising PoolBusy
+        """
+        self.backend_name = backend_name
+        self.model_size = model_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.submit_timeout = submit_timeout
+        self.max_pending = max_pending
+        # Split the cores between workers so they do not oversubscribe the CPU
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        self.threads_per_worker = max(1, cores // workers)
+
+        # spawn: forking a process that already imported torch is not safe
+        self._context = multiprocessing.get_context('spawn')
+        self._jobs = self._context.Queue()
+        self._results = self._context.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._last_revive = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.restarts = 0
+
+        self._processes = [self._spawn() for _ in range(workers)]
+        self._collector = threading.Thread(target=self._collect, name='transcription-results', daemon=True)
+        self._collector.start()
+
+    def _spawn(self):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.backend_name, self.model_size, self.threads_per_worker,
+                  self._jobs, self._results, self.batch_size, self.batch_wait),
+            name='transcription-worker',
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def submit(self, audio):
+        """Queue one float32 16 kHz window and return a Future of its text"""
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy(f"Transcription queue full ({self.max_pending} windows pending)")
+
+        key = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._futures[key] = (future, time.monotonic())
+        self._jobs.put((key, audio))
+        return future
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                key, text, error = self._results.get(timeout=1)
+                self._resolve(key, text, error)
+            except queue.Empty:
+                pass
+            self._expire()
+            self._revive()
+
+    def _pop(self, key):
+        with self._lock:
+            entry = self._futures.pop(key, None)
+        if entry is not None:
+            # The slot frees once the work is accounted for, which is what bounds the queue
+            self._slots.release()
+        return entry
+
+    def _resolve(self, key, text, error):
+        entry = self._pop(key)
+        if entry is None:
+            # Already timed out; the late result is dropped
+            return
+        future, _ = entry
+        if error is None:
+            self.completed += 1
+            future.set_result(text)
+        else:
+            self.failed += 1
+            future.set_exception(RuntimeError(error))
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.timeout
+        with self._lock:
+            expired = [key for key, (_, submitted) in self._futures.items() if submitted < cutoff]
+        for key in expired:
+            entry = self._pop(key)
+            if entry is not None:
+                self.timed_out += 1
+                entry[0].set_exception(TranscriptionTimeout(f"Window not transcribed within {self.timeout}s"))
+
+    def _revive(self):
+        # Rate-limited so a worker that cannot load its model does not respawn in a tight loop
+        if time.monotonic() - self._last_revive < 10:
+            return
+        for index, process in enumerate(self._processes):
+            if not process.is_alive():
+                logger.warning(f"Transcription worker {process.pid} exited ({process.exitcode}), restarting")
+                self._processes[index] = self._spawn()
+                self.restarts += 1
+                self._last_revive = time.monotonic()
+
+    def close(self):
+        self._closed = True
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+
+    def rss_bytes(self):
+        """Resident memory of the live worker processes (0 where /proc is unavailable)"""
+        page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        total = 0
+        for process in self._processes:
+            try:
+                with open(f"/proc/{process.pid}/statm") as statm:
+                    total += int(statm.read().split()[1]) * page_size
+            except (OSError, ValueError, IndexError):
+                continue
+        return total
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._futures)
+        return {
+            'workers': len(self._processes),
+            'rss_bytes': self.rss_bytes(),
+            'alive': sum(process.is_alive() for process in self._processes),
+            'pending': pending,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'failed': self.failed,
+            'timed_out': self.timed_out,
+            'rejected': self.rejected,
+            'restarts': self.restarts,
+        }
+
@@ -4,4 +4,11 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('result/<int:pk>/', views.result_view, name='result'),
+    path('result/<int:pk>/status/', views.result_status, name='result_status'),
+    path('result/<int:pk>/retry/', views.retry_generation, name='retry_generation'),
+    path('result/<int:pk>/upgrade/', views.upgrade_images, name='upgrade_images'),
+    path('result/<int:pk>/events/', views.story_events, name='story_events'),
+    path('stream/', views.story_stream, name='story_stream'),
+    path('api/story/', views.story_api, name='story_api'),
+    path('status/services/', views.service_status, name='service_status'),
 ]
\ No newline at end of file
@@ -0,0 +1,113 @@
+import logging
+from collections import deque
+import numpy as np
+from .audio_decode import SAMPLE_RATE, FRAME_SAMPLES, frame_energy
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class VadStats:
+    """How much audio the voice-activity filter kept and skipped"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.total_samples = 0
+        self.kept_samples = 0
+        self.segments = 0
+
+    @property
+    def total_seconds(self):
+        return self.total_samples / self.sample_rate
+
+    @property
+    def skipped_seconds(self):
+        return (self.total_samples - self.kept_samples) / self.sample_rate
+
+    def as_dict(self):
+        return {
+            'total_seconds': round(self.total_seconds, 2),
+            'skipped_seconds': round(self.skipped_seconds, 2),
+            'skipped_ratio': round(self.skipped_seconds / self.total_seconds, 3) if self.total_samples else None,
+            'segments': self.segments,
+        }
+
+
+def trim_silence(blocks, stats=None, threshold_db=-45.0, padding=0.2, max_pause=0.6, sample_rate=SAMPLE_RATE):
+    """
+    Energy-based voice-activity filter over a stream of float32 blocks
+
+    Leading and trailing silence is dropped; pauses longer than max_pause are cut down
+    to `padding` seconds on either side of the speech, so later windowing still finds
+    quiet cut points. Memory is bounded by the padding, whatever the silence length.
+
+    Args:
+        blocks: Iterable of mono float32 arrays
+        stats (VadStats): Filled in with kept/skipped durations while iterating
+        threshold_db (float): Frames quieter than this (dBFS mean-square energy) are silence
+        padding (float): Seconds of silence kept around each speech segment
+        max_pause (float): Pauses up to this long are kept whole
+
+    Yields:
+        float32 arrays containing the speech with shortened silences
+    """
+    stats = stats if stats is not None else VadStats(sample_rate)
+    threshold = 10 ** (threshold_db / 10)
+    pad_frames = max(1, int(padding * sample_rate / FRAME_SAMPLES))
+    max_pause_frames = max(2 * pad_frames, int(max_pause * sample_rate / FRAME_SAMPLES))
+
+    seen_speech = False
+    in_speech = False
+    silent_frames = 0
+    head = []  # First frames of the current silence (padding after speech)
+    recent = deque(maxlen=max_pause_frames)  # Last frames of the current silence
+    leftover = np.empty(0, dtype=np.float32)
+
+    for block in blocks:
+        stats.total_samples += len(block)
+        samples = np.concatenate([leftover, block]) if len(leftover) else block
+        usable = len(samples) - len(samples) % FRAME_SAMPLES
+        leftover = samples[usable:]
+        if not usable:
+            continue
+
+        frames = samples[:usable].reshape(-1, FRAME_SAMPLES)
+        kept = []
+        for frame, voiced in zip(frames, frame_energy(samples[:usable]) > threshold):
+            if not voiced:
+                in_speech = False
+                silent_frames += 1
+                recent.append(frame)
+                if len(head) < pad_frames:
+                    head.append(frame)
+                continue
+
+            if not in_speech:
+                if not seen_speech:
+                    # Leading silence: keep only the padding before the first word
+                    kept.extend(list(recent)[-pad_frames:])
+                    stats.segments += 1
+                elif silent_frames <= max_pause_frames:
+                    # Short pause: keep it whole so speech rhythm is untouched
+                    kept.extend(recent)
+                else:
+                    # Long pause: keep padding on both sides, skip the middle
+                    kept.extend(head)
+                    kept.extend(list(recent)[-pad_frames:])
+                    stats.segments += 1
+                head = []
+                recent.clear()
+                silent_frames = 0
+                seen_speech = in_speech = True
+            kept.append(frame)
+
+        if kept:
+            out = np.concatenate(kept)
+            stats.kept_samples += len(out)
+            yield out
+
+    # Trailing silence: only the padding after the last speech survives
+    if seen_speech and head:
+        out = np.concatenate(head)
+        stats.kept_samples += len(out)
+        yield out
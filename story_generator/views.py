@@ -1,13 +1,24 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from asgiref.sync import sync_to_async
+import asyncio
+import json
 import logging
-import uuid
+import time
 from .forms import StoryPromptForm
 from .models import StoryGeneration
-from .langchain_service import StoryGenerationService
-from .image_service import ImageGenerationService
-from .audio_service import AudioService
+from .model_health import model_health
+from .llm_cache import get_default_cache
+from .model_store import startup_timings
+from .residency import get_residency_manager
+from .transcription_cache import get_transcription_cache
+from .service_registry import registry, get_story_service, get_image_service
+from .pipeline import list_previews, seed_cached_transcription
+from .tasks import enqueue_generation, enqueue_images, enqueue_upgrade
 
 logger = logging.getLogger(__name__)
 
@@ -23,79 +34,121 @@ def home(request):
     return render(request, 'story_generator/home.html', {'form': form})
 
 def process_generation(request, form):
-    """Process the story generation"""
+    """Queue the story generation and send the user to the progress page"""
     try:
-        # Save form data
-        story_gen = form.save()
+        story_gen = queue_generation(form)
         
-        # Get user prompt
-        user_prompt = story_gen.user_prompt
-        
-        # Handle audio transcription if provided
-        if story_gen.audio_file:
-            audio_service = AudioService()
-            transcription = audio_service.transcribe_audio(story_gen.audio_file)
-            if transcription:
-                user_prompt = transcription
-                story_gen.user_prompt = transcription
-            else:
-                messages.error(request, "Failed to transcribe audio. Please try again.")
-                return redirect('home')
-        
-        # Initialize services
-        langchain_service = StoryGenerationService()
-        image_service = ImageGenerationService()
-        
-        # Generate story and descriptions
-        logger.info("Generating story and descriptions...")
-        content = langchain_service.generate_story_and_descriptions(user_prompt)
-        
-        # Update model with generated content
-        story_gen.story = content['story']
-        story_gen.character_description = content['character_description']
-        story_gen.background_description = content['background_description']
-        
-        # Create image prompts
-        image_prompts = langchain_service.create_image_prompts(
-            content['character_description'],
-            content['background_description']
-        )
-        
-        story_gen.character_image_prompt = image_prompts['character_prompt']
-        story_gen.background_image_prompt = image_prompts['background_prompt']
-        
-        # Generate images
-        logger.info("Generating character image...")
-        character_image = image_service.generate_character_image(
-            image_prompts['character_prompt']
-        )
-        
-        logger.info("Generating background image...")
-        background_image = image_service.generate_background_image(
-            image_prompts['background_prompt']
-        )
-        
-        # Combine images
-        logger.info("Combining images...")
-        combined_image = image_service.combine_images(character_image, background_image)
-        
-        # Save combined image
-        filename = f"combined_{uuid.uuid4().hex}.jpg"
-        image_path = image_service.save_image(combined_image, filename)
-        
-        if image_path:
-            story_gen.combined_image = image_path
-        
-        story_gen.save()
-        
-        messages.success(request, "Story and images generated successfully!")
-        return render(request, 'story_generator/result.html', {'story_gen': story_gen})
+        messages.info(request, "Your story is being generated. This page updates as each stage finishes.")
+        return redirect('result', pk=story_gen.pk)
         
     except Exception as e:
         logger.error(f"Error in process_generation: {e}")
         messages.error(request, f"An error occurred: {str(e)}")
         return redirect('home')
 
+def queue_generation(form):
+    """Save a valid StoryPromptForm and queue its pipeline"""
+    # Save form data
+    story_gen = form.save()
+    
+    # Repeat uploads skip Whisper entirely when their transcript is cached
+    if story_gen.audio_file:
+        seed_cached_transcription(story_gen)
+    
+    # The pipeline runs in Celery workers so this request returns immediately
+    enqueue_generation(story_gen)
+    return story_gen
+
+def _sse_event(event, data, event_id=None):
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def story_stream(request):
+    """Queue a generation from the home form and return where to follow it (CSRF-protected POST)"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    
+    form = StoryPromptForm(request.POST, request.FILES)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    try:
+        story_gen = queue_generation(form)
+    except Exception as e:
+        logger.error(f"Error in story_stream: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+    
+    return JsonResponse({
+        'id': story_gen.pk,
+        'events_url': reverse('story_events', args=[story_gen.pk]),
+        'url': reverse('result', args=[story_gen.pk]),
+    })
+
+async def story_events(request, pk):
+    """
+    Server-Sent Events for a queued job: story tokens as they stream, then stage changes
+    
+    Read-only: everything comes from the job row the Celery workers update, so a
+    client disconnect leaves the job running. Event ids are story offsets, which
+    lets a reconnecting EventSource resume where it stopped. The stream ends once
+    the story is complete; the result page follows the image stages from there.
+    
+    An async generator, so under ASGI each event is sent as soon as it is produced
+    and an open stream holds no worker thread while it waits for the next poll.
+    """
+    if not await StoryGeneration.objects.filter(pk=pk).aexists():
+        return JsonResponse({'error': 'Story not found'}, status=404)
+    
+    poll_interval = getattr(settings, 'STORY_GENERATOR_STREAM_POLL_INTERVAL', 0.25)
+    timeout = getattr(settings, 'STORY_GENERATOR_STREAM_TIMEOUT', 300)
+    try:
+        resume_offset = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        resume_offset = 0
+    result_url = reverse('result', args=[pk])
+    
+    async def events():
+        offset = resume_offset
+        stage = None
+        deadline = time.monotonic() + timeout
+        fields = ['status', 'stage', 'error_message', 'story', 'partial_story']
+        
+        while True:
+            story_gen = await StoryGeneration.objects.only(*fields).aget(pk=pk)
+            
+            if story_gen.stage != stage:
+                stage = story_gen.stage
+                yield _sse_event('stage', {'stage': stage, 'status': story_gen.status})
+            
+            if story_gen.status == StoryGeneration.STATUS_FAILED:
+                yield _sse_event('error', {'message': story_gen.error_message, 'url': result_url})
+                return
+            
+            if story_gen.story:
+                # The saved story is cleaned up, so it replaces the streamed text
+                yield _sse_event('story', {'text': story_gen.story}, len(story_gen.story))
+                yield _sse_event('done', {'id': pk, 'url': result_url})
+                return
+            
+            partial = story_gen.partial_story
+            if len(partial) < offset:
+                # The story stage restarted (e.g. a retried job); start the text over
+                yield _sse_event('story', {'text': partial}, len(partial))
+                offset = len(partial)
+            elif len(partial) > offset:
+                yield _sse_event('token', {'text': partial[offset:]}, len(partial))
+                offset = len(partial)
+            
+            if story_gen.is_finished or time.monotonic() > deadline:
+                yield _sse_event('done', {'id': pk, 'url': result_url})
+                return
+            await asyncio.sleep(poll_interval)
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop nginx from buffering the stream
+    return response
+
 def result_view(request, pk):
     """View individual result"""
     try:
@@ -103,4 +156,127 @@ def result_view(request, pk):
         return render(request, 'story_generator/result.html', {'story_gen': story_gen})
     except StoryGeneration.DoesNotExist:
         messages.error(request, "Story not found.")
-        return redirect('home')
\ No newline at end of file
+        return redirect('home')
+
+def retry_generation(request, pk):
+    """Re-queue a failed job; completed stages are restored instead of recomputed"""
+    if request.method != 'POST':
+        return redirect('result', pk=pk)
+    
+    try:
+        story_gen = StoryGeneration.objects.get(pk=pk)
+    except StoryGeneration.DoesNotExist:
+        messages.error(request, "Story not found.")
+        return redirect('home')
+    
+    if story_gen.status == StoryGeneration.STATUS_FAILED:
+        enqueue_generation(story_gen)
+        messages.info(request, "Resuming generation from the last completed stage.")
+    return redirect('result', pk=pk)
+
+def upgrade_images(request, pk):
+    """Re-render a finished draft at final quality, keeping its story and prompts"""
+    if request.method != 'POST':
+        return redirect('result', pk=pk)
+    
+    try:
+        story_gen = StoryGeneration.objects.get(pk=pk)
+    except StoryGeneration.DoesNotExist:
+        messages.error(request, "Story not found.")
+        return redirect('home')
+    
+    if story_gen.status == StoryGeneration.STATUS_COMPLETED and story_gen.quality != 'final':
+        enqueue_upgrade(story_gen)
+        messages.info(request, "Rendering a final-quality version of your scene.")
+    return redirect('result', pk=pk)
+
+def result_status(request, pk):
+    """Polling endpoint for a generation job's progress"""
+    try:
+        story_gen = StoryGeneration.objects.get(pk=pk)
+    except StoryGeneration.DoesNotExist:
+        return JsonResponse({'error': 'Story not found'}, status=404)
+    
+    return JsonResponse({
+        'id': story_gen.pk,
+        'status': story_gen.status,
+        'stage': story_gen.stage,
+        'error': story_gen.error_message,
+        'finished': story_gen.is_finished,
+        'user_prompt': story_gen.user_prompt,
+        'partial_transcript': story_gen.partial_transcript,
+        'story': story_gen.story,
+        'character_description': story_gen.character_description,
+        'background_description': story_gen.background_description,
+        'combined_image': story_gen.combined_image.url if story_gen.combined_image else None,
+        'previews': {
+            name: f"{settings.MEDIA_URL}{path}?v={mtime}"
+            for name, (path, mtime) in list_previews(story_gen).items()
+        },
+    })
+
+@csrf_exempt
+async def story_api(request):
+    """
+    Async story generation endpoint; runs without holding a worker thread under ASGI
+    
+    Meant for non-browser clients, so it takes no CSRF token and uses no session state.
+    The text is returned directly; the images render on the diffusion queue and can be
+    followed through the job's status URL.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    
+    user_prompt = request.POST.get('user_prompt', '').strip()
+    if not user_prompt:
+        return JsonResponse({'error': 'user_prompt is required'}, status=400)
+    
+    try:
+        # Service loading is blocking, so keep it off the event loop
+        langchain_service = await sync_to_async(get_story_service)()
+        content = await langchain_service.agenerate_story_and_descriptions(user_prompt)
+        
+        image_prompts = langchain_service.create_image_prompts(
+            content['character_description'],
+            content['background_description']
+        )
+        
+        story_gen = StoryGeneration(
+            user_prompt=user_prompt,
+            story=content['story'],
+            character_description=content['character_description'],
+            background_description=content['background_description'],
+            character_image_prompt=image_prompts['character_prompt'],
+            background_image_prompt=image_prompts['background_prompt'],
+            status=StoryGeneration.STATUS_PENDING,
+            stage='queued'
+        )
+        await story_gen.asave()
+        # The saved prompts let the image stages start without re-running the text stages
+        await sync_to_async(enqueue_images)(story_gen)
+        
+        return JsonResponse({
+            'id': story_gen.pk,
+            'status_url': reverse('result_status', args=[story_gen.pk]),
+            'story': story_gen.story,
+            'character_description': story_gen.character_description,
+            'background_description': story_gen.background_description,
+            'model_used': content['model_used']
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in story_api: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+def service_status(request):
+    """Report warm/cold status of the shared model services"""
+    return JsonResponse({
+        'services': registry.status(),
+        'startup_timings': startup_timings.report(),
+        'model_residency': get_residency_manager().stats(),
+        'groq_models': model_health.snapshot(),
+        'llm_cache': get_default_cache().stats() if get_default_cache() else None,
+        'transcription_cache': get_transcription_cache().stats() if get_transcription_cache() else None,
+        # Only reported once loaded; status checks must not trigger a model load
+        'prompt_embeddings': get_image_service().prompt_embedding_stats() if registry.is_warm('image') else None,
+    })
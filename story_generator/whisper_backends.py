@@ -0,0 +1,143 @@
+import logging
+import os
+from django.conf import settings
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'openai-whisper'
+DEFAULT_MODEL_SIZE = 'tiny'
+# whisper.transcribe's defaults for rejecting a greedy decode
+COMPRESSION_RATIO_THRESHOLD = 2.4  # Higher means repetitive output
+LOGPROB_THRESHOLD = -1.0  # Lower means low-confidence output
+NO_SPEECH_THRESHOLD = 0.6  # With a low logprob too, the window is silence
+
+
+class OpenAIWhisperBackend:
+    """Reference openai-whisper model in float32 on the CPU"""
+
+    name = 'openai-whisper'
+
+    def __init__(self, model_size=DEFAULT_MODEL_SIZE):
+        self.model_size = model_size
+
+    def load(self):
+        import whisper
+        from .model_store import load_whisper_model
+
+        if getattr(settings, 'STORY_GENERATOR_MODEL_DIR', None):
+            try:
+                # Memory-mapped checkpoint, shared between worker processes
+                return load_whisper_model(self.model_size, device="cpu")
+            except Exception as e:
+                logger.warning(f"Memory-mapped Whisper load failed, using whisper.load_model: {e}")
+
+        # Load with CPU-specific settings
+        return whisper.load_model(self.model_size, device="cpu")
+
+    def transcribe(self, model, audio, initial_prompt=None):
+        """Transcribe one float32 16 kHz window and return its text"""
+        result = model.transcribe(
+            audio,
+            fp16=False,  # Disable fp16 for CPU
+            verbose=False,
+            initial_prompt=initial_prompt
+        )
+        return result["text"].strip()
+
+    def transcribe_batch(self, model, windows):
+        """
+        Transcribe up to 30 s windows from different uploads with one batched encoder forward
+
+        The batch is decoded greedily. Windows that fail whisper.transcribe's quality checks
+        (repetitive or low-confidence text) are decoded again with transcribe(), which has
+        the temperature fallback, so batching never lowers transcript quality.
+        """
+        import numpy as np
+        import torch
+        import whisper
+
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(
+                whisper.pad_or_trim(torch.from_numpy(np.array(window, dtype=np.float32))),
+                model.dims.n_mels
+            )
+            for window in windows
+        ]).to(model.device)
+        results = whisper.decode(model, mel, whisper.DecodingOptions(fp16=False, without_timestamps=True))
+
+        texts = []
+        for window, result in zip(windows, results):
+            low_confidence = result.avg_logprob < LOGPROB_THRESHOLD
+            if low_confidence and result.no_speech_prob > NO_SPEECH_THRESHOLD:
+                texts.append("")
+            elif low_confidence or result.compression_ratio > COMPRESSION_RATIO_THRESHOLD:
+                logger.info("Batched decode failed quality checks, retrying window with temperature fallback")
+                texts.append(self.transcribe(model, window))
+            else:
+                texts.append(result.text.strip())
+        return texts
+
+
+class QuantizedWhisperBackend(OpenAIWhisperBackend):
+    """openai-whisper with its Linear layers dynamically quantised to int8"""
+
+    name = 'whisper-int8'
+
+    def load(self):
+        import torch
+        import whisper.model
+
+        model = super().load()
+        # whisper's Linear subclass only adds dtype casting, which float32 inference never needs;
+        # quantize_dynamic only converts exact nn.Linear modules
+        for module in model.modules():
+            if type(module) is whisper.model.Linear:
+                module.__class__ = torch.nn.Linear
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class FasterWhisperBackend:
+    """CTranslate2 Whisper (faster-whisper) with int8 CPU kernels"""
+
+    name = 'faster-whisper'
+
+    def __init__(self, model_size=DEFAULT_MODEL_SIZE, compute_type='int8'):
+        self.model_size = model_size
+        self.compute_type = compute_type
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        model_dir = getattr(settings, 'STORY_GENERATOR_MODEL_DIR', None)
+        return WhisperModel(
+            self.model_size,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=getattr(settings, 'STORY_GENERATOR_CPU_THREADS', None) or 0,
+            download_root=os.path.join(str(model_dir), 'faster-whisper') if model_dir else None
+        )
+
+    def transcribe(self, model, audio, initial_prompt=None):
+        segments, _ = model.transcribe(audio, initial_prompt=initial_prompt)
+        # Segments are generated lazily; joining them runs the decode
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def transcribe_batch(self, model, windows):
+        # CTranslate2 batches internally per call; windows are decoded one after another
+        return [self.transcribe(model, window) for window in windows]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (OpenAIWhisperBackend, QuantizedWhisperBackend, FasterWhisperBackend)
+}
+
+
+def create_backend(name=None, model_size=None):
+    """Build the transcription backend configured for this deployment"""
+    name = name or getattr(settings, 'STORY_GENERATOR_WHISPER_BACKEND', DEFAULT_BACKEND)
+    model_size = model_size or getattr(settings, 'STORY_GENERATOR_WHISPER_MODEL', DEFAULT_MODEL_SIZE)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown Whisper backend {name}; choose from {sorted(BACKENDS)}")
+    return BACKENDS[name](model_size)